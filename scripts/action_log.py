@@ -0,0 +1,89 @@
+"""
+Compact, deterministic logs of the actions taken in an episode.
+
+The emulator is deterministic, so the state an episode started from and the actions taken are
+enough to reproduce it exactly. An ActionLog keeps the hash of the starting savestate, act_freq
+and the actions as run-length encoded (action, ticks) pairs - a few KB per episode - so video and
+results can be regenerated offline with replay.py instead of encoded live.
+"""
+
+import hashlib
+import json
+
+
+def state_hash(state: bytes) -> str:
+    return hashlib.sha256(state).hexdigest()
+
+
+class ActionLog:
+    """
+    The actions of one episode as run-length encoded (action, ticks) pairs.
+
+    Every action is held for act_freq ticks and then released, so a run of n ticks replays as
+    n / act_freq separate actions.
+
+    Args:
+        start_hash (str): The state_hash of the savestate the episode started from.
+        act_freq (int): The number of ticks each action is held for.
+        runs (list): Existing [action, ticks] pairs. Defaults to none.
+        results (dict): The final game state of the recorded episode, checked on replay.
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        start_hash: str,
+        act_freq: int,
+        runs: list[list[int]] | None = None,
+        results: dict | None = None,
+    ) -> None:
+        self.start_hash = start_hash
+        self.act_freq = act_freq
+        self.runs = runs if runs is not None else []
+        self.results = results
+
+    def append(self, action: int) -> None:
+        runs = self.runs
+        if runs and runs[-1][0] == action:
+            runs[-1][1] += self.act_freq
+        else:
+            runs.append([action, self.act_freq])
+
+    def actions(self):
+        """
+        Yields every action of the episode in order.
+        """
+        for action, ticks in self.runs:
+            for _ in range(ticks // self.act_freq):
+                yield action
+
+    @property
+    def ticks(self) -> int:
+        return sum(ticks for _, ticks in self.runs)
+
+    def __len__(self) -> int:
+        return self.ticks // self.act_freq
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "version": self.VERSION,
+                    "start_hash": self.start_hash,
+                    "act_freq": self.act_freq,
+                    "runs": self.runs,
+                    "results": self.results,
+                },
+                file,
+                separators=(",", ":"),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "ActionLog":
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+
+        if data.get("version") != cls.VERSION:
+            raise ValueError(f"{path} is action log version {data.get('version')}")
+        return cls(data["start_hash"], data["act_freq"], data["runs"], data["results"])
@@ -0,0 +1,470 @@
+"""
+Micro and macro benchmarks for the Mario Expert agent loop.
+
+Micro benchmarks time each stage of a decision in isolation (emulation with and without
+rendering, game area extraction, entity lookups, choose_action, frame capture, video encoding and
+game_state). Macro benchmarks run the full loop and report frames and decisions per second.
+The capture profile (video recorded, every frame rendered) is compared with the no capture
+profile of enable_no_capture, both as cold starts in a new interpreter and as episodes capped at
+the same tick budget, compared per tick so both profiles are charged for the same work.
+
+Results are written as JSON and can be compared against a stored baseline - any stage that got
+slower by more than the tolerance is reported and the script exits non-zero.
+
+python3 benchmark.py --backend stub --output bench.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from stub_emulator import stub_backend
+
+logging.basicConfig(level=logging.INFO)
+
+CHIBIBO = 15
+
+PROFILES = ("capture", "no_capture")
+
+# Run in a fresh interpreter per sample, so imports and emulator creation are paid cold
+_STARTUP = """
+import json, sys, time
+
+profile, backend, results_path = sys.argv[1:]
+
+start = time.perf_counter()
+from mario_expert import MarioExpert
+imported = time.perf_counter()
+
+if backend == "stub":
+    from stub_emulator import stub_backend
+
+    with stub_backend():
+        expert = MarioExpert(results_path=results_path, headless=True)
+else:
+    expert = MarioExpert(results_path=results_path, headless=True)
+if profile == "no_capture":
+    expert.enable_no_capture()
+expert.environment.pyboy.set_emulation_speed(0)
+built = time.perf_counter()
+
+# The first step as play() takes it, including starting the video when there is one
+environment = expert.environment
+if expert.record_video:
+    frame = environment.grab_frame()
+    height, width, _ = frame.shape
+    expert.start_video(f"{results_path}/startup.mp4", width, height)
+    expert.video.write_screen(environment.screen.ndarray)
+expert.step()
+if expert.record_video:
+    expert.stop_video()
+stepped = time.perf_counter()
+
+print(json.dumps({
+    "import": imported - start,
+    "construct": built - imported,
+    "first_step": stepped - built,
+    "cv2_loaded": "cv2" in sys.modules,
+}))
+"""
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument(
+        "--backend",
+        choices=["auto", "rom", "stub"],
+        default="auto",
+        help="Emulator to benchmark, auto uses the ROM when it is installed",
+    )
+    parse_args.add_argument("--iterations", type=int, default=500)
+    parse_args.add_argument("--decisions", type=int, default=1000)
+    parse_args.add_argument(
+        "--startup_runs",
+        type=int,
+        default=5,
+        help="Cold starts timed per profile, 0 skips the startup comparison",
+    )
+    parse_args.add_argument(
+        "--episodes",
+        type=int,
+        default=1,
+        help="Episodes played per profile, 0 skips the episode comparison",
+    )
+    parse_args.add_argument(
+        "--episode_ticks",
+        type=int,
+        default=1200,
+        help="Ticks each episode is capped at, so both profiles play the same frames",
+    )
+    parse_args.add_argument("--output", type=str, default=None)
+    parse_args.add_argument("--baseline", type=str, default=None)
+    parse_args.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown relative to the baseline before a stage is flagged",
+    )
+
+    return parse_args.parse_args()
+
+
+def time_stage(function, iterations, setup=None) -> dict:
+    """
+    Runs function iterations times and returns timing statistics in microseconds.
+
+    setup runs before every call and is not timed.
+    """
+    samples = np.empty(iterations, dtype=np.int64)
+    for i in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter_ns()
+        function()
+        samples[i] = time.perf_counter_ns() - start
+
+    samples = samples / 1000.0
+    return {
+        "unit": "us",
+        "mean": float(samples.mean()),
+        "p50": float(np.percentile(samples, 50)),
+        "p99": float(np.percentile(samples, 99)),
+    }
+
+
+def create_expert(backend, results_path):
+    # Imported late so the stub backend can be installed before the emulator is created
+    from mario_expert import MarioExpert
+
+    if backend == "stub":
+        with stub_backend():
+            expert = MarioExpert(results_path=results_path, headless=True)
+    else:
+        expert = MarioExpert(results_path=results_path, headless=True)
+
+    expert.environment.pyboy.set_emulation_speed(0)
+    return expert
+
+
+def micro_benchmarks(expert, iterations, results_path) -> dict:
+    from mario_environment import MarioEnvironment
+    from mario_expert import EntityIndex
+    from video_encoder import AsyncVideoWriter
+
+    environment = expert.environment
+    pyboy = environment.pyboy
+    environment.reset()
+
+    def invalidate():
+        # Forces the controller's cached reads to be recomputed
+        environment._observation = None
+
+    def tick():
+        # PyBoy's game wrapper caches the game area until the next tick, so without one every
+        # call after the first would time its cache instead of the extraction
+        pyboy.tick(1, False)
+        invalidate()
+
+    def advance():
+        environment.run_action(2)
+        invalidate()
+
+    stages = {}
+    stages["tick_render"] = time_stage(lambda: pyboy.tick(1, True), iterations)
+    stages["tick_no_render"] = time_stage(lambda: pyboy.tick(1, False), iterations)
+    stages["run_action"] = time_stage(lambda: environment.run_action(2), iterations)
+
+    stages["game_area_uncached"] = time_stage(
+        lambda: MarioEnvironment.game_area(environment), iterations, tick
+    )
+    stages["game_area"] = time_stage(environment.game_area, iterations, tick)
+
+    game_area = environment.game_area()
+    stages["entity_index_build"] = time_stage(
+        lambda: EntityIndex(game_area), iterations
+    )
+    stages["get_player_position"] = time_stage(
+        expert.get_player_position, iterations, tick
+    )
+    stages["get_obstacle_position"] = time_stage(
+        lambda: expert.get_obstacle_position(CHIBIBO), iterations, tick
+    )
+    stages["choose_action"] = time_stage(expert.choose_action, iterations, advance)
+
+    stages["game_state_uncached"] = time_stage(
+        lambda: MarioEnvironment.game_state(environment), iterations, tick
+    )
+    stages["game_state"] = time_stage(environment.game_state, iterations, tick)
+
+    stages["grab_frame"] = time_stage(environment.grab_frame, iterations)
+
+    frame = environment.grab_frame()
+    height, width, _ = frame.shape
+
+    video = cv2.VideoWriter(
+        f"{results_path}/sync.mp4", cv2.VideoWriter_fourcc(*"mp4v"), 30, (width, height)
+    )
+    stages["video_write"] = time_stage(lambda: video.write(frame), iterations)
+    video.release()
+
+    video = AsyncVideoWriter(f"{results_path}/async.mp4", width, height)
+    stages["video_write_screen_async"] = time_stage(
+        lambda: video.write_screen(environment.screen.ndarray), iterations
+    )
+    video.release()
+
+    return stages
+
+
+def macro_benchmarks(expert, decisions, results_path) -> dict:
+    from video_encoder import AsyncVideoWriter
+
+    environment = expert.environment
+    runs = {}
+
+    for name, capture in (("loop_no_capture", False), ("loop_with_video", True)):
+        environment.reset()
+        video = None
+        if capture:
+            frame = environment.grab_frame()
+            height, width, _ = frame.shape
+            video = AsyncVideoWriter(f"{results_path}/{name}.mp4", width, height)
+
+        start_frame = environment.pyboy.frame_count
+        done = 0
+        start = time.perf_counter()
+        while done < decisions and not environment.get_game_over():
+            if video is not None:
+                video.write_screen(environment.screen.ndarray)
+            expert.step()
+            done += 1
+        if video is not None:
+            video.release()
+        elapsed = time.perf_counter() - start
+
+        frames = environment.pyboy.frame_count - start_frame
+        runs[name] = {
+            "decisions": done,
+            "seconds": elapsed,
+            "decisions_per_second": done / elapsed,
+            "frames_per_second": frames / elapsed,
+        }
+
+    return runs
+
+
+def startup_benchmarks(backend, runs, results_path) -> dict:
+    """
+    Times cold starts of the capture and no capture profiles, each in a new interpreter.
+    """
+    scripts_path = f"{Path(__file__).parent}"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [scripts_path, env.get("PYTHONPATH")])
+    )
+
+    startup = {}
+    for profile in PROFILES:
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, "-c", _STARTUP, profile, backend, results_path],
+                capture_output=True,
+                check=True,
+                cwd=scripts_path,
+                env=env,
+                text=True,
+            )
+            sample = json.loads(completed.stdout.strip().splitlines()[-1])
+            sample["total"] = time.perf_counter() - start
+            samples.append(sample)
+
+        startup[profile] = {
+            stage: float(np.median([sample[stage] for sample in samples]))
+            for stage in ("import", "construct", "first_step", "total")
+        }
+        startup[profile]["cv2_loaded"] = any(sample["cv2_loaded"] for sample in samples)
+
+    return startup
+
+
+def episode_benchmarks(expert, episodes, max_ticks=1200) -> dict:
+    """
+    Plays episodes with play() under the capture and no capture profiles, each ended by the
+    watchdog after max_ticks so the profiles are timed over the same ticks.
+    """
+    environment = expert.environment
+    watchdog = expert.watchdog
+    expert.enable_watchdog(max_ticks=max_ticks)
+    runs = {}
+
+    for profile in PROFILES:
+        if profile == "no_capture":
+            expert.enable_no_capture()
+        else:
+            expert.record_video = True
+            environment.render_frames = True
+
+        ticks = 0
+        start = time.perf_counter()
+        for _ in range(episodes):
+            expert.play()
+            ticks += environment.ticks
+        elapsed = time.perf_counter() - start
+
+        runs[profile] = {
+            "episodes": episodes,
+            "ticks": ticks,
+            "seconds_per_episode": elapsed / episodes,
+            "us_per_tick": elapsed / ticks * 1e6,
+        }
+
+    expert.watchdog = watchdog
+    return runs
+
+
+def compare(results, baseline, tolerance) -> list[str]:
+    """
+    Returns a message for every stage that is slower than the baseline by more than tolerance.
+    """
+    regressions = []
+
+    for stage, stats in results["micro"].items():
+        base = baseline.get("micro", {}).get(stage)
+        if base is None:
+            continue
+        ratio = stats["p50"] / base["p50"] if base["p50"] else 1.0
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{stage}: p50 {base['p50']:.1f}us -> {stats['p50']:.1f}us ({ratio:.2f}x)"
+            )
+
+    for run, stats in results["macro"].items():
+        base = baseline.get("macro", {}).get(run)
+        if base is None:
+            continue
+        ratio = base["decisions_per_second"] / stats["decisions_per_second"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{run}: {base['decisions_per_second']:.0f} -> "
+                f"{stats['decisions_per_second']:.0f} decisions/s ({ratio:.2f}x slower)"
+            )
+
+    for profile, stats in results.get("startup", {}).items():
+        base = baseline.get("startup", {}).get(profile)
+        if base is None:
+            continue
+        ratio = stats["total"] / base["total"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"startup {profile}: {base['total']:.3f}s -> {stats['total']:.3f}s "
+                f"({ratio:.2f}x)"
+            )
+
+    for profile, stats in results.get("episode", {}).items():
+        base = baseline.get("episode", {}).get(profile)
+        # Baselines from before the tick budget timed episodes of different lengths
+        if base is None or "us_per_tick" not in base:
+            continue
+        ratio = stats["us_per_tick"] / base["us_per_tick"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"episode {profile}: {base['us_per_tick']:.1f}us/tick -> "
+                f"{stats['us_per_tick']:.1f}us/tick ({ratio:.2f}x)"
+            )
+
+    return regressions
+
+
+def run_benchmarks(
+    backend, iterations, decisions, startup_runs=5, episodes=1, episode_ticks=1200
+) -> dict:
+    if backend == "auto":
+        rom_path = f"{Path(__file__).parent.parent}/roms/mario/SuperMarioLand.gb"
+        backend = "rom" if os.path.exists(rom_path) else "stub"
+    logging.info(f"Benchmarking with the {backend} backend")
+
+    with tempfile.TemporaryDirectory() as results_path:
+        expert = create_expert(backend, results_path)
+        results = {
+            "backend": backend,
+            "machine": platform.node(),
+            "python": platform.python_version(),
+            "timestamp": time.time(),
+            "micro": micro_benchmarks(expert, iterations, results_path),
+            "macro": macro_benchmarks(expert, decisions, results_path),
+        }
+        if startup_runs:
+            results["startup"] = startup_benchmarks(backend, startup_runs, results_path)
+        if episodes:
+            results["episode"] = episode_benchmarks(expert, episodes, episode_ticks)
+        expert.environment.pyboy.stop(save=False)
+
+    return results
+
+
+def main():
+    args = get_args()
+
+    results = run_benchmarks(
+        args.backend,
+        args.iterations,
+        args.decisions,
+        args.startup_runs,
+        args.episodes,
+        args.episode_ticks,
+    )
+
+    for stage, stats in results["micro"].items():
+        logging.info(
+            f"{stage:>26}: p50 {stats['p50']:9.1f}us  p99 {stats['p99']:9.1f}us"
+        )
+    for run, stats in results["macro"].items():
+        logging.info(
+            f"{run:>26}: {stats['decisions_per_second']:9.1f} decisions/s "
+            f"{stats['frames_per_second']:9.1f} frames/s"
+        )
+    for profile, stats in results.get("startup", {}).items():
+        logging.info(
+            f"{'startup_' + profile:>26}: {stats['total']:9.3f}s total "
+            f"(import {stats['import']:.3f}s construct {stats['construct']:.3f}s "
+            f"first step {stats['first_step']:.3f}s) cv2 loaded: {stats['cv2_loaded']}"
+        )
+    for profile, stats in results.get("episode", {}).items():
+        logging.info(
+            f"{'episode_' + profile:>26}: {stats['us_per_tick']:9.1f}us/tick "
+            f"over {stats['ticks']} ticks ({stats['seconds_per_episode']:.3f}s/episode)"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+
+        if baseline.get("backend") != results["backend"]:
+            logging.warning("Baseline was recorded with a different backend")
+
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            logging.error(f"Regression - {regression}")
+        if regressions:
+            raise SystemExit(1)
+        logging.info("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
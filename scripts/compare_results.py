@@ -1,35 +1,22 @@
 import argparse
-import glob
-import json
 import logging
-from functools import cmp_to_key
 
-logging.basicConfig(level=logging.INFO)
-
-
-def compare_performance(results_one, results_two):
-    if results_one["world"] > results_two["world"]:
-        return -1
-    elif results_one["world"] < results_two["world"]:
-        return 1
-
-    if results_one["stage"] > results_two["stage"]:
-        return -1
-    elif results_one["stage"] < results_two["stage"]:
-        return 1
+from leaderboard import Leaderboard
 
-    if results_one["score"] > results_two["score"]:
-        return -1
-    elif results_one["score"] < results_two["score"]:
-        return 1
-
-    return 0
+logging.basicConfig(level=logging.INFO)
 
 
 def get_args():
     parse_args = argparse.ArgumentParser()
 
     parse_args.add_argument("-r", "--results_path", type=str, required=True)
+    parse_args.add_argument("-k", "--top", type=int, default=None)
+    parse_args.add_argument(
+        "-a",
+        "--aggregate",
+        action="store_true",
+        help="Rank each UPI by its best run with means over all of its runs",
+    )
 
     return parse_args.parse_args()
 
@@ -39,28 +26,28 @@ def main():
 
     results_path = args.results_path
 
-    result_directories = glob.glob(f"{results_path}/*")
-    logging.info(f"Found {len(result_directories)} results directories")
-    logging.info(f"Results directories: {result_directories}")
-
     logging.info(f"Comparing results in {results_path}")
 
-    results = []
-    for result_directory in result_directories:
-        upi = result_directory.split("/")[-1]
-        logging.info(f"Reading results for UPI: {upi}")
-
-        with open(f"{result_directory}/results.json", "r", encoding="utf-8") as file:
-            result = json.load(file)
-            result["upi"] = upi
+    leaderboard = Leaderboard(results_path)
+    loaded = leaderboard.refresh()
+    logging.info(
+        f"Found {len(leaderboard.entries)} results, read {loaded} new or changed"
+    )
 
-            results.append(result)
+    if args.aggregate:
+        for i, summary in enumerate(leaderboard.aggregate()[: args.top]):
+            best = summary["best"]
+            logging.info(
+                f"Rank {i + 1}: {summary['upi']} - World: {best['world']} Stage: {best['stage']} Score: {best['score']}"
+                f" ({summary['runs']} runs, mean score {summary['mean_score']:.1f}, mean x {summary['mean_x_position']:.1f})"
+            )
+        return
 
-    results = sorted(results, key=cmp_to_key(compare_performance))
+    results = leaderboard.top(args.top) if args.top else leaderboard.ranked()
 
     for i, result in enumerate(results):
         logging.info(
-            f"Rank {i + 1}: {result['upi']} - World: {result['world']} Stage: {result['stage']} Score: {result['score']}"
+            f"Rank {i + 1}: {result['run']} - World: {result['world']} Stage: {result['stage']} Score: {result['score']}"
         )
 
 
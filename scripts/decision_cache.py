@@ -0,0 +1,201 @@
+"""
+Memoised decisions keyed on the neighbourhood around Mario.
+
+Most decisions only depend on a small window of the game area around Mario, and the same windows
+recur constantly as the level scrolls. DecisionCache hashes a fixed-size patch of tile classes
+centred on Mario, together with Mario's position and which entity classes are on screen, into a
+64 bit key and keeps the action chosen for it in a bounded LRU.
+
+Rules may also read beyond the patch, so the key covers those inputs too: every position of the
+tracked entity classes relative to Mario (enough for offsets to the first enemy and enemies in
+his row or column), the cells of fixed rows across the patch's columns, and any inputs from
+outside the game area the caller passes in. With those declared a hit returns exactly the action
+the rules would choose.
+
+A hit skips the rule base (and any lookahead) entirely.
+
+The cache can be saved to and loaded from an .npz file so later runs start warm.
+"""
+
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+
+class DecisionCache:
+    """
+    A bounded LRU of actions keyed by the neighbourhood around Mario.
+
+    Args:
+        rows (int): The height of the patch. Defaults to 8.
+        cols (int): The width of the patch. Defaults to 10.
+        behind (int): How many of the patch's columns are behind Mario. Defaults to 3.
+        below (int): How many of the patch's rows are below Mario. Defaults to 2.
+        classes (tuple): Entity classes whose positions anywhere on screen decisions depend on.
+            Defaults to none.
+        fixed_rows (tuple): Rows decisions read at a fixed index rather than relative to Mario.
+            Defaults to none.
+        capacity (int): The number of decisions kept. Defaults to 65536.
+        path (str): An .npz file to load the cache from, and save it to with save().
+    """
+
+    def __init__(
+        self,
+        rows: int = 8,
+        cols: int = 10,
+        behind: int = 3,
+        below: int = 2,
+        classes: tuple[int, ...] = (),
+        fixed_rows: tuple[int, ...] = (),
+        capacity: int = 65536,
+        path: str | None = None,
+    ) -> None:
+        self.rows = rows
+        self.cols = cols
+        self.behind = behind
+        self.below = below
+        self.classes = classes
+        self.fixed_rows = fixed_rows
+        self.capacity = capacity
+        self.path = path
+
+        self.entries: OrderedDict[int, int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._padded: np.ndarray | None = None
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def key(
+        self,
+        game_area: np.ndarray,
+        mario: tuple[int, int],
+        entities,
+        extra: bytes = b"",
+    ) -> int:
+        """
+        Returns the key of the patch around mario and the rule inputs beyond it, cells outside
+        the game area read as 0.
+
+        Args:
+            game_area (np.ndarray): The game area the decision is made from.
+            mario (tuple): Mario's (row, col).
+            entities (EntityIndex): The index of game_area.
+            extra (bytes): Rule inputs that are not in the game area. Defaults to none.
+        """
+        area_rows, area_cols = game_area.shape
+        if self._padded is None or self._padded.shape != (
+            area_rows + 2 * self.rows,
+            area_cols + 2 * self.cols,
+        ):
+            self._padded = np.zeros(
+                (area_rows + 2 * self.rows, area_cols + 2 * self.cols), dtype=np.uint8
+            )
+        padded = self._padded
+        padded[self.rows : self.rows + area_rows, self.cols : self.cols + area_cols] = (
+            game_area
+        )
+
+        # The padding shifts every cell by (rows, cols)
+        top = mario[0] + self.below + 1
+        left = self.cols + mario[1] - self.behind
+        patch = padded[top : top + self.rows, left : left + self.cols]
+
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(patch.tobytes())
+        digest.update(bytes((mario[0] & 0xFF, mario[1] & 0xFF)))
+        present = entities.present()
+        digest.update(bytes(value & 0xFF for value in present))
+
+        for row in self.fixed_rows:
+            digest.update(padded[self.rows + row, left : left + self.cols].tobytes())
+        for value in self.classes:
+            if value in present:
+                positions = entities.all(value) - np.asarray(mario)
+                digest.update(bytes((value,)))
+                digest.update(positions.astype(np.int8).tobytes())
+        digest.update(extra)
+        return int.from_bytes(digest.digest(), "little")
+
+    def get(self, key: int) -> int | None:
+        action = self.entries.get(key)
+        if action is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return action
+
+    def put(self, key: int, action: int) -> None:
+        self.entries[key] = action
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def save(self, path: str | None = None) -> None:
+        """
+        Writes the cache, least recently used first, to path or the path it was created with.
+        """
+        path = path or self.path
+        keys = np.fromiter(
+            self.entries.keys(), dtype=np.uint64, count=len(self.entries)
+        )
+        actions = np.fromiter(
+            self.entries.values(), dtype=np.uint8, count=len(self.entries)
+        )
+
+        # np.savez adds .npz to names without it, so write to a name that already has it
+        temp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            temp_path,
+            geometry=np.array([self.rows, self.cols, self.behind, self.below]),
+            classes=np.array(self.classes, dtype=np.int64),
+            fixed_rows=np.array(self.fixed_rows, dtype=np.int64),
+            keys=keys,
+            actions=actions,
+        )
+        os.replace(temp_path, path)
+
+    def load(self, path: str) -> None:
+        with np.load(path) as data:
+            geometry = data["geometry"].tolist()
+            inputs = [
+                data[name].tolist() if name in data else None
+                for name in ("classes", "fixed_rows")
+            ]
+            if geometry != [self.rows, self.cols, self.behind, self.below]:
+                logging.warning(
+                    f"Ignoring decision cache {path}, it was built with a different patch"
+                )
+                return
+            if inputs != [list(self.classes), list(self.fixed_rows)]:
+                logging.warning(
+                    f"Ignoring decision cache {path}, it was keyed on different inputs"
+                )
+                return
+            keys = data["keys"].tolist()
+            actions = data["actions"].tolist()
+
+        for key, action in zip(keys[-self.capacity :], actions[-self.capacity :]):
+            self.entries[key] = action
+        logging.info(f"Loaded {len(self.entries)} cached decisions from {path}")
@@ -0,0 +1,443 @@
+"""
+A long-lived daemon that runs Mario Expert episodes on warm emulators.
+
+Starting run.py imports OpenCV, numpy and PyBoy, loads the ROM and parses init.state before the
+first frame runs. The daemon pays that once: each of its workers imports the framework and
+builds an emulator at startup, then waits for jobs. A job - "run the MarioExpert in this
+workspace for K episodes" - arrives over a Unix socket and is run in a fork of a warm worker, so
+the agent's module, globals and any changes it makes to the emulator are thrown away with the
+fork and never leak into the next job. The first environment the agent creates is handed the
+warm emulator, reset from the in-memory initial state, instead of building a new one. The
+results of each episode are streamed back as it finishes.
+
+python3 emulator_daemon.py serve --workers 8
+python3 emulator_daemon.py run --upi your_upi --workspace ../submissions/your_upi --episodes 4
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import select
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import time
+from multiprocessing.connection import Connection
+from pathlib import Path
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_SOCKET = f"{tempfile.gettempdir()}/mario-emulator.sock"
+
+# The warm emulator owned by each worker process, and the stub backend kept active in it
+_warm = None
+_backend = contextlib.ExitStack()
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+    parse_args.add_argument("--socket", type=str, default=DEFAULT_SOCKET)
+
+    commands = parse_args.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Start the daemon")
+    serve.add_argument("--workers", type=int, default=os.cpu_count())
+    serve.add_argument("--backend", choices=["rom", "stub"], default="rom")
+
+    run = commands.add_parser("run", help="Run episodes on a running daemon")
+    run.add_argument("--upi", type=str, required=True)
+    run.add_argument(
+        "--workspace",
+        type=str,
+        default=f"{Path(__file__).parent}",
+        help="Directory holding the mario_expert.py to run",
+    )
+    run.add_argument("--episodes", type=int, default=1)
+    run.add_argument(
+        "--results_path",
+        type=str,
+        default=None,
+        help="Defaults to results/<upi> as run.py does",
+    )
+    run.add_argument(
+        "--fast",
+        action="store_true",
+        help="Run the emulator as fast as it will go instead of at the agent's speed",
+    )
+    run.add_argument("--timeout", type=float, default=None, help="Seconds per job")
+    run.add_argument(
+        "--env",
+        type=str,
+        nargs="*",
+        default=[],
+        help="KEY=VALUE environment variables set for the agent",
+    )
+
+    return parse_args.parse_args()
+
+
+class _Handoff:
+    """
+    Stands in for pyboy_environment.PyBoy inside a job, handing the warm emulator to the
+    agent's environment. Only one environment can hold it at a time, any other is given a new
+    emulator.
+    """
+
+    def __init__(self, pyboy, rom_path: str, state: bytes, factory) -> None:
+        self.pyboy = pyboy
+        self.rom_path = rom_path
+        self.state = state
+        self.factory = factory
+        self.free = True
+
+    def __call__(self, rom_path: str, window: str = "null"):
+        # The daemon has no display, every emulator is headless
+        if not self.free or rom_path != self.rom_path:
+            return self.factory(rom_path, window="null")
+
+        self.free = False
+        self.pyboy.load_state(io.BytesIO(self.state))
+        return self.pyboy
+
+    def release(self) -> None:
+        self.free = True
+
+
+def _warm_up(backend: str) -> None:
+    # Everything a job would otherwise import and build on its first line
+    # pylint: disable=import-outside-toplevel
+    import pyboy_environment
+
+    if backend == "stub":
+        from stub_emulator import stub_backend
+
+        _backend.enter_context(stub_backend())
+
+    from mario_expert import MarioController
+
+    controller = MarioController(headless=True)
+
+    global _warm  # pylint: disable=global-statement
+    _warm = _Handoff(
+        controller.pyboy,
+        controller.rom_path,
+        controller.savestates.file_initial,
+        pyboy_environment.PyBoy,
+    )
+
+    # Jobs import their own mario_expert, only the framework it builds on stays loaded
+    del sys.modules["mario_expert"]
+
+
+def _episode_path(results_path: str, episodes: int, episode: int) -> str:
+    # A single episode writes where run.py would
+    if episodes == 1:
+        return results_path
+    return f"{results_path}/episode_{episode:04d}"
+
+
+def _run_job(connection: Connection, job: dict) -> None:
+    # pylint: disable=import-outside-toplevel
+    import pyboy_environment
+
+    results_path = job["results_path"]
+    os.makedirs(results_path, exist_ok=True)
+
+    # Whatever the agent logs or prints goes next to its results, not to the daemon
+    log = os.open(f"{results_path}/daemon.log", os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    os.dup2(log, 1)
+    os.dup2(log, 2)
+
+    os.environ.update(job["env"])
+    os.chdir(job["workspace"])
+    sys.path.insert(0, job["workspace"])
+    pyboy_environment.PyBoy = _warm
+
+    module = importlib.import_module("mario_expert")
+
+    for episode in range(job["episodes"]):
+        path = _episode_path(results_path, job["episodes"], episode)
+        os.makedirs(path, exist_ok=True)
+
+        start = time.perf_counter()
+        expert = module.MarioExpert(results_path=path, headless=True)
+        if job["fast"]:
+            expert.environment.pyboy.set_emulation_speed(0)
+        expert.play()
+        elapsed = time.perf_counter() - start
+        del expert
+        _warm.release()
+
+        with open(f"{path}/results.json", "r", encoding="utf-8") as file:
+            results = json.load(file)
+        connection.send(
+            {
+                "event": "episode",
+                "episode": episode,
+                "results_path": path,
+                "results": results,
+                "elapsed": elapsed,
+            }
+        )
+
+
+def _serve_worker(connection: Connection, backend: str) -> None:
+    _warm_up(backend)
+    connection.send({"event": "ready", "pid": os.getpid()})
+
+    while True:
+        job = connection.recv()
+        if job is None:
+            break
+        if not isinstance(job, dict):
+            # A cancellation that crossed the end of the job it was meant for
+            continue
+
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                _run_job(connection, job)
+            except BaseException as error:  # pylint: disable=broad-exception-caught
+                logging.exception("Job failed")
+                connection.send({"event": "error", "message": repr(error)})
+                status = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)  # pylint: disable=protected-access
+
+        # The fork writes its events straight to the connection, this end only listens for a
+        # cancellation and enforces the timeout
+        deadline = None if job["timeout"] is None else time.monotonic() + job["timeout"]
+        message = None
+        while True:
+            finished, status = os.waitpid(pid, os.WNOHANG)
+            if finished:
+                break
+            if deadline is not None and time.monotonic() > deadline:
+                message = f"timed out after {job['timeout']}s"
+            elif connection.poll(0.05) and connection.recv() == "cancel":
+                message = "cancelled"
+            else:
+                continue
+            # SIGKILL cannot be ignored, block until the fork is gone instead of polling again
+            os.kill(pid, signal.SIGKILL)
+            _, status = os.waitpid(pid, 0)
+            break
+
+        code = os.waitstatus_to_exitcode(status)
+        if message is None and code < 0:
+            message = f"killed by signal {-code}"
+        if message is not None:
+            connection.send({"event": "error", "message": message})
+        connection.send({"event": "done", "status": code})
+
+
+class _Worker:
+    def __init__(self, context, backend: str) -> None:
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve_worker, args=(child, backend), daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.pid = self.connection.recv()["pid"]
+
+    def close(self) -> None:
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+class EmulatorDaemon(socketserver.ThreadingUnixStreamServer):
+    """
+    Serves jobs on a pool of warm workers, one job per worker at a time.
+
+    Args:
+        socket_path (str): The Unix socket to listen on.
+        workers (int): The number of warm workers, and so of jobs run at once.
+        backend (str): "rom" to run the game, "stub" to run StubPyBoy. Defaults to "rom".
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, workers: int, backend: str = "rom") -> None:
+        # Workers are spawned, forking a process that is already serving threads is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.backend = backend
+        self.workers: queue.Queue[_Worker] = queue.Queue()
+        for _ in range(workers):
+            self.workers.put(_Worker(self.context, backend))
+
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _JobHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        while not self.workers.empty():
+            self.workers.get().close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.server_address)
+
+    def run(self, job: dict, send, connected) -> None:
+        """
+        Runs a job on the next free worker, passing every event it produces to send. The job is
+        cancelled once connected returns False.
+        """
+        try:
+            worker = self.workers.get_nowait()
+        except queue.Empty:
+            with contextlib.suppress(OSError):
+                send({"event": "queued"})
+            worker = self.workers.get()
+
+        client_gone = False
+        running = False
+
+        def forward(message: dict) -> None:
+            if client_gone:
+                return
+            try:
+                send(message)
+            except OSError:
+                cancel()
+
+        def cancel() -> None:
+            # The client went away, stop the job and let the worker wind down
+            nonlocal client_gone
+            client_gone = True
+            # Once the job is done the worker is idle, and would take a cancellation for the
+            # next job
+            if running:
+                worker.connection.send("cancel")
+
+        try:
+            worker.connection.send(job)
+            running = True
+            forward({"event": "started", "worker": worker.pid})
+            while True:
+                # A job can run for minutes without an event, check on the client meanwhile
+                while not worker.connection.poll(0.5):
+                    if not client_gone and not connected():
+                        cancel()
+                message = worker.connection.recv()
+                if message["event"] == "done":
+                    running = False
+                forward(message)
+                if not running:
+                    break
+        except (EOFError, OSError) as error:
+            running = False
+            logging.error(f"Worker {worker.pid} died: {error!r}, replacing it")
+            worker.close()
+            worker = _Worker(self.context, self.backend)
+            forward({"event": "error", "message": "worker died"})
+            forward({"event": "done", "status": -1})
+        finally:
+            self.workers.put(worker)
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            job = json.loads(self.rfile.readline())
+        except json.JSONDecodeError as error:
+            self._send({"event": "error", "message": f"bad request: {error}"})
+            return
+
+        logging.info(
+            f"Running {job['workspace']}/mario_expert.py for {job['episodes']} episodes"
+        )
+        self.server.run(job, self._send, self._connected)
+
+    def _connected(self) -> bool:
+        # Clients send nothing after the request, so a readable socket has been closed
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        return not readable or self.connection.recv(1, socket.MSG_PEEK) != b""
+
+    def _send(self, message: dict) -> None:
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+        self.wfile.flush()
+
+
+def request(socket_path: str, job: dict):
+    """
+    Submits a job to the daemon and yields its events as they arrive.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(job).encode() + b"\n")
+        with client.makefile("rb") as stream:
+            for line in stream:
+                message = json.loads(line)
+                yield message
+                if message["event"] == "done":
+                    return
+
+
+def main():
+    args = get_args()
+
+    if args.command == "serve":
+        # Stop as on Ctrl+C, closing the workers and removing the socket
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        daemon = EmulatorDaemon(args.socket, args.workers, args.backend)
+        logging.info(f"Serving {args.workers} warm workers on {args.socket}")
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            daemon.server_close()
+        return
+
+    results_path = args.results_path
+    if results_path is None:
+        results_path = f"{Path(__file__).parent.parent}/results/{args.upi}"
+    logging.info(f"Saving data into: {results_path}")
+
+    job = {
+        "workspace": os.path.abspath(args.workspace),
+        "results_path": os.path.abspath(results_path),
+        "episodes": args.episodes,
+        "fast": args.fast,
+        "timeout": args.timeout,
+        "env": dict(item.split("=", 1) for item in args.env),
+    }
+
+    failed = False
+    for message in request(args.socket, job):
+        event = message["event"]
+        if event == "queued":
+            logging.info("Waiting for a free worker")
+        elif event == "episode":
+            logging.info(
+                f"Episode {message['episode']} in {message['elapsed']:.1f}s - "
+                f"Final Stats: {message['results']}"
+            )
+        elif event == "error":
+            failed = True
+            logging.error(f"Job failed: {message['message']}")
+        elif event == "done" and message["status"] != 0:
+            failed = True
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
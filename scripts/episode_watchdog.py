@@ -0,0 +1,116 @@
+"""
+Early termination of episodes that have stopped making progress or run out of budget.
+
+play() otherwise runs until the game is over, and an agent stuck against a pipe or dithering
+LEFT/RIGHT in front of an enemy burns every remaining tick of every life until the in-game timer
+kills it. The Watchdog ends the episode as soon as one of its limits is hit and reports why,
+where it got to and an estimate of the ticks that were saved.
+"""
+
+import time
+
+# The in-game timer counts down once every this many ticks
+TICKS_PER_TIME_UNIT = 40
+
+# Wider than any level, so progress through later stages always ranks above earlier ones
+LEVEL_WIDTH = 10000
+
+GAME_OVER = "game_over"
+STALLED = "stalled"
+WALL_CLOCK = "wall_clock"
+MAX_TICKS = "max_ticks"
+
+
+def progress(state: dict) -> int:
+    """
+    How far through the game a state is, comparable across stages.
+    """
+    level = (state["world"] - 1) * 3 + state["stage"] - 1
+    return level * LEVEL_WIDTH + state["x_position"]
+
+
+class Watchdog:
+    """
+    Decides when an episode should end before the game is over.
+
+    Args:
+        stall_ticks (int): End the episode when progress has not improved for this many ticks.
+            The count starts over whenever a life is lost. None disables.
+        wall_seconds (float): End the episode after this many seconds. None disables.
+        max_ticks (int): End the episode after this many ticks. None disables.
+    """
+
+    def __init__(
+        self,
+        stall_ticks: int | None = None,
+        wall_seconds: float | None = None,
+        max_ticks: int | None = None,
+    ) -> None:
+        self.stall_ticks = stall_ticks
+        self.wall_seconds = wall_seconds
+        self.max_ticks = max_ticks
+
+        self.reason: str | None = None
+        self._start_frame = 0
+        self._start_time = 0.0
+        self._best = 0
+        self._best_frame = 0
+        self._lives = 0
+        self._state: dict = {}
+        self._frame = 0
+
+    def start(self, frame: int, state: dict) -> None:
+        self.reason = None
+        self._start_frame = self._best_frame = self._frame = frame
+        self._start_time = time.perf_counter()
+        self._best = progress(state)
+        self._lives = state["lives"]
+        self._state = state
+
+    def check(self, frame: int, state: dict) -> str | None:
+        """
+        Returns the reason the episode should end now, or None to carry on.
+        """
+        self._frame = frame
+        self._state = state
+
+        current = progress(state)
+        if state["lives"] != self._lives:
+            # Mario starts over from the last checkpoint, give him a fresh allowance
+            self._lives = state["lives"]
+            self._best = current
+            self._best_frame = frame
+        elif current > self._best:
+            self._best = current
+            self._best_frame = frame
+
+        if state["game_over"]:
+            self.reason = GAME_OVER
+        elif (
+            self.stall_ticks is not None
+            and frame - self._best_frame >= self.stall_ticks
+        ):
+            self.reason = STALLED
+        elif self.max_ticks is not None and frame - self._start_frame >= self.max_ticks:
+            self.reason = MAX_TICKS
+        elif (
+            self.wall_seconds is not None
+            and time.perf_counter() - self._start_time >= self.wall_seconds
+        ):
+            self.reason = WALL_CLOCK
+        return None if self.reason == GAME_OVER else self.reason
+
+    def report(self) -> dict:
+        """
+        The termination fields added to results.json. ticks_saved estimates the ticks the
+        current life would have taken to run out its timer, 0 if the game ended by itself.
+        """
+        state = self._state
+        saved = 0
+        if self.reason not in (None, GAME_OVER):
+            saved = state["time"] * TICKS_PER_TIME_UNIT
+        return {
+            "termination": self.reason or GAME_OVER,
+            "ticks": self._frame - self._start_frame,
+            "ticks_saved": saved,
+        }
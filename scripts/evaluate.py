@@ -0,0 +1,282 @@
+"""
+Batch evaluation of the Mario Expert agent.
+
+Runs many headless episodes across a process pool. Each worker keeps one warm MarioExpert for its
+whole lifetime and resets it between episodes. Every episode writes its own results.json in the
+same way play() does, and the batch writes a summary with percentiles and throughput. Episodes
+run without capturing the screen unless --video is given.
+
+The expert and the emulator are deterministic, so each episode's seed picks a number of idle
+frames (up to --noop_max) the game runs before the expert takes over. Without them every
+episode from the same savestate would play out identically.
+
+python3 evaluate.py --name my_sweep --episodes 64 --workers 32
+"""
+
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+SUMMARY_FIELDS = ["world", "stage", "score", "x_position"]
+PERCENTILES = [10, 50, 90]
+
+# The warm expert owned by each worker process
+_expert = None
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("--name", type=str, required=True)
+    parse_args.add_argument("--episodes", type=int, default=8)
+    parse_args.add_argument("--workers", type=int, default=os.cpu_count())
+    parse_args.add_argument("--seed", type=int, default=0)
+    parse_args.add_argument(
+        "--noop_max",
+        type=int,
+        default=30,
+        help="Each episode idles a seeded 0 to noop_max frames before the expert starts",
+    )
+    parse_args.add_argument(
+        "--checkpoints",
+        type=str,
+        nargs="*",
+        default=[],
+        help="Savestate files to start episodes from, assigned round-robin",
+    )
+    parse_args.add_argument(
+        "--video",
+        action="store_true",
+        help="Record mario_expert.mp4 for every episode, skipped by default",
+    )
+    parse_args.add_argument(
+        "--publish",
+        action="store_true",
+        help="Publish each worker's live observations for monitor.py",
+    )
+    parse_args.add_argument(
+        "--stall_ticks",
+        type=int,
+        default=None,
+        help="End episodes that make no progress for this many ticks",
+    )
+    parse_args.add_argument(
+        "--wall_seconds", type=float, default=None, help="Budget per episode"
+    )
+    parse_args.add_argument(
+        "--max_ticks", type=int, default=None, help="Budget per episode"
+    )
+
+    return parse_args.parse_args()
+
+
+def _init_worker(
+    video: bool = False, publish: str | None = None, watchdog: dict | None = None
+):
+    # Imported here so the parent process never loads the emulator
+    from mario_expert import MarioExpert  # pylint: disable=import-outside-toplevel
+
+    global _expert  # pylint: disable=global-statement
+    _expert = MarioExpert(results_path="", headless=True)
+    # Nobody is watching, run the emulator as fast as it will go
+    _expert.environment.pyboy.set_emulation_speed(0)
+    if not video:
+        _expert.enable_no_capture()
+    if publish is not None:
+        _expert.enable_shared_observation(f"{publish}-{os.getpid()}")
+    if watchdog:
+        _expert.enable_watchdog(**watchdog)
+
+
+def noop_frames(seed: int, noop_max: int) -> int:
+    """
+    The idle frames the episode with seed starts with.
+    """
+    return random.Random(seed).randint(0, noop_max)
+
+
+def run_episode(episode: dict) -> dict:
+    results_path = episode["results_path"]
+    os.makedirs(results_path, exist_ok=True)
+
+    # Only seeds agents that use randomness, the expert and the emulator are deterministic
+    random.seed(episode["seed"])
+    np.random.seed(episode["seed"])
+
+    environment = _expert.environment
+    savestates = environment.savestates
+    if episode["checkpoint"] is not None:
+        with open(episode["checkpoint"], "rb") as file:
+            savestates.set_initial(file.read())
+    else:
+        savestates.set_initial(None)
+
+    # The idle frames shift enemies and timers relative to Mario, which is the variation
+    # between seeds the emulator actually sees
+    if episode["noop_frames"]:
+        environment.reset()
+        environment.advance(episode["noop_frames"])
+        initial = environment.capture_state()
+        savestates.set_initial(initial)
+        # Kept so replay.py --states can find the state actions.json started from
+        with open(f"{results_path}/initial.state", "wb") as file:
+            file.write(initial)
+
+    _expert.results_path = results_path
+
+    start = time.perf_counter()
+    _expert.play()
+    elapsed = time.perf_counter() - start
+
+    with open(f"{results_path}/results.json", "r", encoding="utf-8") as file:
+        results = json.load(file)
+
+    return {**episode, "elapsed": elapsed, "results": results}
+
+
+def summarise(episodes: list[dict], wall_time: float) -> dict:
+    summary = {
+        "episodes": len(episodes),
+        "wall_time": wall_time,
+        "episodes_per_hour": len(episodes) / wall_time * 3600 if wall_time > 0 else 0.0,
+    }
+
+    for field in SUMMARY_FIELDS:
+        values = np.array(
+            [episode["results"][field] for episode in episodes], dtype=np.float64
+        )
+        if not len(values):
+            continue
+        summary[field] = {
+            "mean": float(values.mean()),
+            "min": float(values.min()),
+            "max": float(values.max()),
+            **{f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES},
+        }
+
+    terminations = [
+        episode["results"]["termination"]
+        for episode in episodes
+        if "termination" in episode["results"]
+    ]
+    if terminations:
+        summary["terminations"] = {
+            reason: terminations.count(reason) for reason in sorted(set(terminations))
+        }
+        summary["ticks"] = sum(episode["results"]["ticks"] for episode in episodes)
+        summary["ticks_saved"] = sum(
+            episode["results"]["ticks_saved"] for episode in episodes
+        )
+
+    return summary
+
+
+def evaluate(
+    name,
+    episodes,
+    workers,
+    seed=0,
+    checkpoints=None,
+    video=False,
+    publish=False,
+    watchdog=None,
+    noop_max=30,
+):
+    batch_path = f"{Path(__file__).parent.parent}/results/{name}"
+    logging.info(f"Saving data into: {batch_path}")
+
+    checkpoints = checkpoints or [None]
+    jobs = [
+        {
+            "episode": i,
+            "seed": seed + i,
+            "noop_frames": noop_frames(seed + i, noop_max),
+            "checkpoint": checkpoints[i % len(checkpoints)],
+            "results_path": f"{batch_path}/episode_{i:04d}",
+        }
+        for i in range(episodes)
+    ]
+
+    workers = max(1, min(workers, episodes))
+    logging.info(f"Running {episodes} episodes on {workers} workers")
+
+    start = time.perf_counter()
+    completed = []
+    with multiprocessing.Pool(
+        processes=workers,
+        initializer=_init_worker,
+        initargs=(video, name if publish else None, watchdog),
+    ) as pool:
+        for result in pool.imap_unordered(run_episode, jobs):
+            completed.append(result)
+            logging.info(
+                f"Episode {result['episode']} ({len(completed)}/{episodes}) - "
+                f"World: {result['results']['world']} Stage: {result['results']['stage']} "
+                f"Score: {result['results']['score']} in {result['elapsed']:.1f}s"
+            )
+    wall_time = time.perf_counter() - start
+
+    completed.sort(key=lambda result: result["episode"])
+    summary = summarise(completed, wall_time)
+    summary["runs"] = completed
+
+    with open(f"{batch_path}/summary.json", "w", encoding="utf-8") as file:
+        json.dump(summary, file, indent=2)
+
+    logging.info(f"{summary['episodes_per_hour']:.1f} episodes per hour")
+    if "terminations" in summary:
+        logging.info(
+            f"Terminations: {summary['terminations']}, "
+            f"{summary['ticks_saved']} ticks saved of {summary['ticks']} played"
+        )
+    for field in SUMMARY_FIELDS:
+        if field in summary:
+            stats = summary[field]
+            logging.info(
+                f"{field}: mean {stats['mean']:.1f} "
+                + " ".join(f"p{p} {stats[f'p{p}']:.1f}" for p in PERCENTILES)
+            )
+
+    return summary
+
+
+def main():
+    args = get_args()
+
+    checkpoints = []
+    for pattern in args.checkpoints:
+        checkpoints.extend(sorted(glob.glob(pattern)) or [pattern])
+
+    limits = {
+        "stall_ticks": args.stall_ticks,
+        "wall_seconds": args.wall_seconds,
+        "max_ticks": args.max_ticks,
+    }
+    # Only episodes with a limit are watched, so results.json is unchanged without one
+    watchdog = {name: value for name, value in limits.items() if value is not None}
+
+    evaluate(
+        args.name,
+        args.episodes,
+        args.workers,
+        args.seed,
+        checkpoints,
+        args.video,
+        args.publish,
+        watchdog,
+        args.noop_max,
+    )
+
+
+if __name__ == "__main__":
+    main()
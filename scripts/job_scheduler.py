@@ -0,0 +1,258 @@
+"""
+A bounded-concurrency scheduler for evaluation subprocesses.
+
+Jobs are persisted to a JSON queue file so an interrupted batch resumes where it stopped. At most
+`workers` jobs run at once; each is killed if it exceeds its wall-clock budget or stops making
+progress (nothing in its results directory grows for `stall_timeout` seconds) and is retried if
+it crashes. The CPU time, peak RSS and elapsed time of every attempt are written to usage.json
+next to its results.json.
+"""
+
+import json
+import logging
+import os
+import signal
+import subprocess
+import time
+from dataclasses import asdict, dataclass, field
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    name: str
+    command: list[str]
+    results_path: str
+    cwd: str | None = None
+    # Only the variables to set on top of the scheduler's environment, which is never persisted
+    env: dict[str, str] | None = None
+    state: str = PENDING
+    attempts: int = 0
+    history: list[dict] = field(default_factory=list)
+
+
+def _output_size(results_path: str) -> int:
+    # run.py only logs when an episode starts and ends, so the video and results it writes along
+    # the way are the heartbeat of a healthy run
+    size = 0
+    with os.scandir(results_path) as entries:
+        for entry in entries:
+            if entry.name != "usage.json" and entry.is_file(follow_symlinks=False):
+                size += entry.stat(follow_symlinks=False).st_size
+    return size
+
+
+class _Running:
+    def __init__(self, job: Job, process: subprocess.Popen, log_path: str) -> None:
+        self.job = job
+        self.process = process
+        self.log_path = log_path
+        self.start = time.monotonic()
+        self.last_progress = self.start
+        self.output_size = 0
+        self.reason: str | None = None
+
+
+class JobScheduler:
+    """
+    Runs a persistent queue of jobs on a bounded pool of subprocesses.
+
+    Args:
+        queue_path (str): The JSON file the queue is persisted to.
+        workers (int): The maximum number of concurrent jobs. Defaults to the number of cores.
+        timeout (float): Wall-clock seconds before a job is killed, 0 disables. Defaults to 0.
+        stall_timeout (float): Seconds without any file in the job's results directory growing
+            before it is killed, 0 disables. Defaults to 0.
+        retries (int): How many times a crashed or killed job is re-run. Defaults to 1.
+        report_interval (float): Seconds between progress reports. Defaults to 10.
+    """
+
+    def __init__(
+        self,
+        queue_path: str,
+        workers: int | None = None,
+        timeout: float = 0,
+        stall_timeout: float = 0,
+        retries: int = 1,
+        report_interval: float = 10,
+    ) -> None:
+        self.queue_path = queue_path
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.retries = retries
+        self.report_interval = report_interval
+
+        self.jobs: dict[str, Job] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(queue_path)), exist_ok=True)
+        self._load()
+
+    def add(self, job: Job, force: bool = False) -> None:
+        """
+        Queues a job unless a job with the same name already finished in a previous run and
+        force is not set.
+        """
+        existing = self.jobs.get(job.name)
+        if existing is not None and existing.state == DONE and not force:
+            logging.info(f"Skipping {job.name} - already completed")
+            return
+        self.jobs[job.name] = job
+        self._save()
+
+    def run(self) -> dict[str, Job]:
+        running: list[_Running] = []
+        last_report = 0.0
+
+        try:
+            while True:
+                pending = [job for job in self.jobs.values() if job.state == PENDING]
+
+                while pending and len(running) < self.workers:
+                    running.append(self._start(pending.pop(0)))
+
+                if not running:
+                    break
+
+                now = time.monotonic()
+                still_running = []
+                for run in running:
+                    if self._poll(run, now):
+                        continue
+                    still_running.append(run)
+                running = still_running
+
+                if now - last_report >= self.report_interval:
+                    self._report(running)
+                    last_report = now
+
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            # Leave the queue resumable, killed jobs go back to pending
+            for run in running:
+                self._kill(run.process)
+                run.job.state = PENDING
+            self._save()
+            raise
+
+        self._report([])
+        return self.jobs
+
+    def _start(self, job: Job) -> _Running:
+        os.makedirs(job.results_path, exist_ok=True)
+        job.attempts += 1
+        job.state = RUNNING
+        self._save()
+
+        log_path = f"{job.results_path}/run.log"
+        with open(log_path, "ab") as log:
+            process = subprocess.Popen(
+                job.command,
+                cwd=job.cwd,
+                env={**os.environ, **job.env} if job.env else None,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        logging.info(f"Started {job.name} (attempt {job.attempts}) pid {process.pid}")
+        return _Running(job, process, log_path)
+
+    def _poll(self, run: _Running, now: float) -> bool:
+        # wait4 reaps the child and reports its resource usage in one call
+        pid, status, usage = os.wait4(run.process.pid, os.WNOHANG)
+
+        if pid == 0:
+            size = _output_size(run.job.results_path)
+            if size != run.output_size:
+                run.output_size = size
+                run.last_progress = now
+
+            if self.timeout and now - run.start > self.timeout:
+                run.reason = "timeout"
+            elif self.stall_timeout and now - run.last_progress > self.stall_timeout:
+                run.reason = "stalled"
+            else:
+                return False
+
+            logging.warning(f"Killing {run.job.name}: {run.reason}")
+            self._kill(run.process)
+            _, status, usage = os.wait4(run.process.pid, 0)
+
+        # Popen must not try to reap the child again
+        run.process.returncode = os.waitstatus_to_exitcode(status)
+        self._finish(run, usage, time.monotonic() - run.start)
+        return True
+
+    def _finish(self, run: _Running, usage, elapsed: float) -> None:
+        job = run.job
+        exit_code = run.process.returncode
+
+        attempt = {
+            "attempt": job.attempts,
+            "exit_code": exit_code,
+            "reason": run.reason or ("ok" if exit_code == 0 else "crashed"),
+            "elapsed": elapsed,
+            "cpu_seconds": usage.ru_utime + usage.ru_stime,
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": usage.ru_maxrss / 1024,
+        }
+        job.history.append(attempt)
+
+        with open(f"{job.results_path}/usage.json", "w", encoding="utf-8") as file:
+            json.dump(attempt, file)
+
+        if exit_code == 0 and run.reason is None:
+            job.state = DONE
+        elif job.attempts <= self.retries:
+            logging.warning(
+                f"{job.name} {attempt['reason']} (exit {exit_code}), retrying"
+            )
+            job.state = PENDING
+        else:
+            logging.error(
+                f"{job.name} {attempt['reason']} (exit {exit_code}), giving up"
+            )
+            job.state = FAILED
+
+        self._save()
+
+    def _kill(self, process: subprocess.Popen) -> None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _report(self, running: list[_Running]) -> None:
+        counts = {state: 0 for state in (PENDING, RUNNING, DONE, FAILED)}
+        for job in self.jobs.values():
+            counts[job.state] += 1
+
+        names = ", ".join(
+            f"{run.job.name} {time.monotonic() - run.start:.0f}s" for run in running
+        )
+        logging.info(
+            f"Progress: {counts[DONE]} done, {counts[FAILED]} failed, "
+            f"{counts[RUNNING]} running, {counts[PENDING]} pending"
+            + (f" [{names}]" if names else "")
+        )
+
+    def _load(self) -> None:
+        if not os.path.exists(self.queue_path):
+            return
+
+        with open(self.queue_path, "r", encoding="utf-8") as file:
+            for data in json.load(file):
+                job = Job(**data)
+                # Anything that was running when the last batch died is run again
+                if job.state == RUNNING:
+                    job.state = PENDING
+                self.jobs[job.name] = job
+
+    def _save(self) -> None:
+        temp_path = f"{self.queue_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump([asdict(job) for job in self.jobs.values()], file, indent=2)
+        os.replace(temp_path, self.queue_path)
@@ -0,0 +1,164 @@
+"""
+An incremental leaderboard over a directory of results.
+
+Every results.json under the results directory (<upi>/results.json, or <upi>/<episode>/results.json
+for batch runs) is loaded once and cached in an index file keyed by path, size and mtime. Later
+refreshes only stat the tree and read new or changed files, in parallel. Runs are ranked by a
+single composite sort key instead of a Python comparator.
+"""
+
+import heapq
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+INDEX_NAME = ".leaderboard.json"
+RESULTS_NAME = "results.json"
+# The fields performance_key cannot rank a run without
+REQUIRED_FIELDS = ("world", "stage", "score")
+
+
+def performance_key(result: dict) -> tuple:
+    """
+    Sort key that ranks the best run first: furthest world, then stage, then highest score,
+    with ties broken by x_position and the time left on the clock.
+    """
+    return (
+        -result["world"],
+        -result["stage"],
+        -result["score"],
+        -result.get("x_position", 0),
+        -result.get("time", 0),
+    )
+
+
+class Leaderboard:
+    """
+    Ranks every run under a results directory, caching parsed results between invocations.
+
+    Args:
+        results_path (str): The directory holding one folder per upi.
+        workers (int): The number of threads used to read changed files. Defaults to 16.
+    """
+
+    def __init__(self, results_path: str, workers: int = 16) -> None:
+        self.results_path = results_path
+        self.index_path = f"{results_path}/{INDEX_NAME}"
+        self.workers = workers
+
+        # path -> {"stamp": [size, mtime_ns], "result": {...}}
+        self.entries: dict[str, dict] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+
+    def _scan(self) -> dict[str, list[int]]:
+        stamps = {}
+        for upi_entry in os.scandir(self.results_path):
+            if not upi_entry.is_dir():
+                continue
+            candidates = [f"{upi_entry.path}/{RESULTS_NAME}"]
+            for episode in os.scandir(upi_entry.path):
+                if episode.is_dir():
+                    candidates.append(f"{episode.path}/{RESULTS_NAME}")
+
+            for path in candidates:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                stamps[os.path.relpath(path, self.results_path)] = [
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                ]
+        return stamps
+
+    def _load(self, path: str) -> dict | None:
+        try:
+            with open(f"{self.results_path}/{path}", "r", encoding="utf-8") as file:
+                result = json.load(file)
+        except (OSError, ValueError) as error:
+            logging.warning(f"Could not read {path}: {error}")
+            return None
+
+        if not isinstance(result, dict):
+            logging.warning(f"Skipping {path}: not a results object")
+            return None
+        missing = [name for name in REQUIRED_FIELDS if name not in result]
+        if missing:
+            # A partial or foreign results.json must not break the whole ranking
+            logging.warning(f"Skipping {path}: missing {', '.join(missing)}")
+            return None
+
+        parts = path.split(os.sep)
+        result["upi"] = parts[0]
+        result["run"] = os.sep.join(parts[:-1])
+        return result
+
+    def refresh(self) -> int:
+        """
+        Brings the index up to date with the results directory and returns how many files were
+        read.
+        """
+        stamps = self._scan()
+
+        removed = [path for path in self.entries if path not in stamps]
+        for path in removed:
+            del self.entries[path]
+
+        changed = [
+            path
+            for path, stamp in stamps.items()
+            if self.entries.get(path, {}).get("stamp") != stamp
+        ]
+
+        if changed:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for path, result in zip(changed, pool.map(self._load, changed)):
+                    if result is None:
+                        self.entries.pop(path, None)
+                    else:
+                        self.entries[path] = {"stamp": stamps[path], "result": result}
+
+        if changed or removed:
+            temp_path = f"{self.index_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(self.entries, file)
+            os.replace(temp_path, self.index_path)
+
+        return len(changed)
+
+    def results(self) -> list[dict]:
+        return [entry["result"] for entry in self.entries.values()]
+
+    def ranked(self) -> list[dict]:
+        return sorted(self.results(), key=performance_key)
+
+    def top(self, k: int) -> list[dict]:
+        return heapq.nsmallest(k, self.results(), key=performance_key)
+
+    def aggregate(self) -> list[dict]:
+        """
+        Summarises every upi's runs, ranked by their best run.
+        """
+        runs: dict[str, list[dict]] = {}
+        for result in self.results():
+            runs.setdefault(result["upi"], []).append(result)
+
+        summaries = []
+        for upi, results in runs.items():
+            count = len(results)
+            summaries.append(
+                {
+                    "upi": upi,
+                    "runs": count,
+                    "best": min(results, key=performance_key),
+                    **{
+                        f"mean_{field}": sum(r.get(field, 0) for r in results) / count
+                        for field in ("world", "stage", "score", "x_position")
+                    },
+                }
+            )
+
+        return sorted(summaries, key=lambda summary: performance_key(summary["best"]))
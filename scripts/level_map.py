@@ -0,0 +1,203 @@
+"""
+A stitched map of a whole level built from successive game_area windows.
+
+Each observation is written into a growing, chunked array indexed by absolute tile column, taken
+from the camera position (x_position less Mario's position on screen, which is the scroll
+register and level block). Only columns that have not been seen before are processed. Enemies and
+Mario are left out of the terrain, the columns enemies were first seen in are kept as spawns.
+
+Each column is classified once when it is revealed and filed in sorted indexes of gaps, pipes,
+platforms and spawns, so "where is the next gap" is a binary search instead of a scan of
+game_area[15]. Maps are saved per world and stage so later runs start from a known map.
+"""
+
+import bisect
+import os
+
+import numpy as np
+
+GROUND = 10
+PIPE = 14
+SOLID = (10, 11, 12, 13, 14)
+ENEMIES = (15, 16, 17, 18, 19, 20, 21, 22, 23, 25)
+# Mario, his vehicles, power ups, projectiles and explosions never belong to the terrain
+DYNAMIC = (1, 2, 3, 4, 6, 7, 8, 24, 26) + ENEMIES
+
+GAP = 1
+PIPES = 2
+PLATFORM = 4
+SPAWN = 8
+
+FEATURES = {"gaps": GAP, "pipes": PIPES, "platforms": PLATFORM, "spawns": SPAWN}
+
+_SOLID_LOOKUP = np.isin(np.arange(256), SOLID)
+_DYNAMIC_LOOKUP = np.isin(np.arange(256), DYNAMIC)
+_ENEMY_LOOKUP = np.isin(np.arange(256), ENEMIES)
+
+
+class LevelMap:
+    """
+    The terrain of one level, stitched together from game area windows.
+
+    Args:
+        rows (int): The height of the game area. Defaults to 16.
+        chunk_columns (int): The number of columns allocated at a time. Defaults to 64.
+    """
+
+    def __init__(self, rows: int = 16, chunk_columns: int = 64) -> None:
+        self.rows = rows
+        self.chunk_columns = chunk_columns
+
+        # chunk number -> (terrain (rows, chunk_columns), features, known)
+        self.chunks: dict[int, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self.indexes: dict[int, list[int]] = {flag: [] for flag in FEATURES.values()}
+        self.width = 0
+
+    def _chunk(self, number: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        chunk = self.chunks.get(number)
+        if chunk is None:
+            chunk = (
+                np.zeros((self.rows, self.chunk_columns), dtype=np.uint8),
+                np.zeros(self.chunk_columns, dtype=np.uint8),
+                np.zeros(self.chunk_columns, dtype=bool),
+            )
+            self.chunks[number] = chunk
+        return chunk
+
+    def known(self, column: int) -> bool:
+        chunk = self.chunks.get(column // self.chunk_columns)
+        return chunk is not None and bool(chunk[2][column % self.chunk_columns])
+
+    def update(self, game_area: np.ndarray, camera_column: int) -> int:
+        """
+        Writes the columns of game_area that have not been seen before, the first of which is
+        at camera_column, and returns how many there were.
+        """
+        written = 0
+        cols = game_area.shape[1]
+        for offset in range(max(0, -camera_column), cols):
+            column = camera_column + offset
+            number, index = divmod(column, self.chunk_columns)
+            terrain, features, known = self._chunk(number)
+            if known[index]:
+                continue
+
+            tiles = game_area[:, offset]
+            dynamic = _DYNAMIC_LOOKUP[tiles]
+            terrain[:, index] = np.where(dynamic, 0, tiles)
+            features[index] = self._classify(terrain[:, index], tiles)
+            known[index] = True
+
+            for flag, columns in self.indexes.items():
+                if features[index] & flag:
+                    bisect.insort(columns, column)
+            self.width = max(self.width, column + 1)
+            written += 1
+        return written
+
+    def _classify(self, terrain: np.ndarray, tiles: np.ndarray) -> int:
+        solid = _SOLID_LOOKUP[terrain]
+        flags = 0
+        if terrain[-1] == 0:
+            flags |= GAP
+        if (terrain == PIPE).any():
+            flags |= PIPES
+        # A solid tile with open space above it, above the ground rows
+        if (solid[1:-2] & ~solid[:-3]).any():
+            flags |= PLATFORM
+        if _ENEMY_LOOKUP[tiles].any():
+            flags |= SPAWN
+        return flags
+
+    def tile(self, row: int, column: int) -> int:
+        """
+        Returns the terrain tile at an absolute position, 0 if it has not been seen.
+        """
+        chunk = self.chunks.get(column // self.chunk_columns)
+        if chunk is None or column < 0:
+            return 0
+        return int(chunk[0][row, column % self.chunk_columns])
+
+    def features(self, column: int) -> int:
+        chunk = self.chunks.get(column // self.chunk_columns)
+        if chunk is None or column < 0:
+            return 0
+        return int(chunk[1][column % self.chunk_columns])
+
+    def window(self, column: int, width: int) -> np.ndarray:
+        """
+        Returns the (rows, width) terrain starting at column, unseen columns read as 0.
+        """
+        window = np.zeros((self.rows, width), dtype=np.uint8)
+        for offset in range(width):
+            chunk = self.chunks.get((column + offset) // self.chunk_columns)
+            if chunk is not None and column + offset >= 0:
+                window[:, offset] = chunk[0][:, (column + offset) % self.chunk_columns]
+        return window
+
+    def columns(self, feature: int) -> list[int]:
+        return self.indexes[feature]
+
+    def next(self, feature: int, column: int, limit: int | None = None) -> int | None:
+        """
+        Returns the first column at or after column with feature, or None if there is none
+        within limit columns.
+        """
+        columns = self.indexes[feature]
+        index = bisect.bisect_left(columns, column)
+        if index == len(columns):
+            return None
+        found = columns[index]
+        if limit is not None and found - column >= limit:
+            return None
+        return found
+
+    @staticmethod
+    def path(directory: str, world: int, stage: int) -> str:
+        return f"{directory}/level-{world}-{stage}.npz"
+
+    def save(self, path: str) -> None:
+        numbers = sorted(self.chunks)
+        terrain = np.zeros((len(numbers), self.rows, self.chunk_columns), np.uint8)
+        features = np.zeros((len(numbers), self.chunk_columns), np.uint8)
+        known = np.zeros((len(numbers), self.chunk_columns), bool)
+        for i, number in enumerate(numbers):
+            terrain[i], features[i], known[i] = self.chunks[number]
+
+        # np.savez adds .npz to names without it, so write to a name that already has it
+        temp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            temp_path,
+            geometry=np.array([self.rows, self.chunk_columns]),
+            numbers=np.array(numbers, dtype=np.int64),
+            terrain=terrain,
+            features=features,
+            known=known,
+        )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LevelMap":
+        with np.load(path) as data:
+            rows, chunk_columns = data["geometry"].tolist()
+            level_map = cls(rows=rows, chunk_columns=chunk_columns)
+            for number, terrain, features, known in zip(
+                data["numbers"].tolist(),
+                data["terrain"],
+                data["features"],
+                data["known"],
+            ):
+                level_map.chunks[number] = (
+                    terrain.copy(),
+                    features.copy(),
+                    known.copy(),
+                )
+
+        for number, (_, features, known) in sorted(level_map.chunks.items()):
+            for index in np.flatnonzero(known).tolist():
+                column = number * chunk_columns + index
+                for flag, columns in level_map.indexes.items():
+                    if features[index] & flag:
+                        columns.append(column)
+                level_map.width = max(level_map.width, column + 1)
+        return level_map
@@ -0,0 +1,148 @@
+"""
+Watches every agent on this machine that publishes its observations to shared memory.
+
+Agents publish when MarioExpert.enable_shared_observation is called or MARIO_SHARED_OBSERVATION
+is set, evaluate.py --publish does so for each of its workers. Every interval the latest
+observation of each agent is read straight from shared memory and logged, and with --mosaic
+their screens are tiled into a single image.
+
+python3 monitor.py --interval 1 --mosaic ../results/mosaic.png
+"""
+
+import argparse
+import logging
+import math
+import os
+import time
+
+import numpy as np
+from shared_observation import ObservationSubscriber, list_publishers
+
+logging.basicConfig(level=logging.INFO)
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("--interval", type=float, default=1.0)
+    parse_args.add_argument(
+        "--once", action="store_true", help="Report once and exit instead of watching"
+    )
+    parse_args.add_argument(
+        "--mosaic",
+        type=str,
+        default=None,
+        help="Image file the screens of every agent are tiled into each interval",
+    )
+
+    return parse_args.parse_args()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_mosaic(path: str, screens: list[np.ndarray]) -> None:
+    # Imported here so watching without a mosaic never loads OpenCV
+    import cv2  # pylint: disable=import-outside-toplevel
+
+    columns = math.ceil(math.sqrt(len(screens)))
+    rows = math.ceil(len(screens) / columns)
+    height, width, _ = screens[0].shape
+
+    mosaic = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+    for i, screen in enumerate(screens):
+        row, column = divmod(i, columns)
+        mosaic[
+            row * height : (row + 1) * height, column * width : (column + 1) * width
+        ] = cv2.cvtColor(screen, cv2.COLOR_RGBA2BGR)
+    cv2.imwrite(path, mosaic)
+
+
+class Monitor:
+    """
+    Keeps a subscriber attached to every live publisher and reports their progress.
+    """
+
+    def __init__(self) -> None:
+        self.subscribers: dict[str, ObservationSubscriber] = {}
+        # name -> (published, time) at the last report, for the step rate
+        self.last: dict[str, tuple[int, float]] = {}
+
+    def refresh(self) -> None:
+        names = set(list_publishers())
+
+        for name in list(self.subscribers):
+            if name not in names:
+                logging.info(f"{name}: finished")
+                self.subscribers.pop(name).close()
+                self.last.pop(name, None)
+
+        for name in sorted(names - self.subscribers.keys()):
+            try:
+                self.subscribers[name] = ObservationSubscriber(name)
+            except (FileNotFoundError, ValueError) as error:
+                # Gone between listing and attaching, or not an observation ring
+                logging.debug(f"{name}: {error}")
+
+    def report(self) -> list[np.ndarray]:
+        screens = []
+        for name, subscriber in sorted(self.subscribers.items()):
+            observation = subscriber.latest()
+            if observation is None:
+                continue
+
+            now = time.monotonic()
+            published, then = self.last.get(name, (observation.published, now))
+            rate = (
+                (observation.published - published) / (now - then)
+                if now > then
+                else 0.0
+            )
+            self.last[name] = (observation.published, now)
+
+            state = observation.state
+            status = "" if _alive(observation.pid) else " (not running)"
+            logging.info(
+                f"{name}: World {state['world']}-{state['stage']} "
+                f"x {state['x_position']} score {state['score']} lives {state['lives']} "
+                f"time {state['time']} - {rate:.1f} steps/s{status}"
+            )
+            screens.append(observation.screen)
+        return screens
+
+    def close(self) -> None:
+        for subscriber in self.subscribers.values():
+            subscriber.close()
+        self.subscribers.clear()
+
+
+def main():
+    args = get_args()
+
+    monitor = Monitor()
+    try:
+        while True:
+            monitor.refresh()
+            screens = monitor.report()
+            if not monitor.subscribers:
+                logging.info("No agents are publishing")
+            if args.mosaic and screens:
+                write_mosaic(args.mosaic, screens)
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.close()
+
+
+if __name__ == "__main__":
+    main()
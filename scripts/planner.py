@@ -0,0 +1,306 @@
+"""
+Savestate lookahead planning for the Mario Expert agent.
+
+The planner saves the emulator state, simulates every short sequence of candidate actions by
+restoring and stepping the controller, scores where each sequence ends up and returns the first
+action of the best one. The search deepens one level at a time and stops at a per-decision time
+budget, so the result is always the best sequence of the deepest level that finished.
+
+Simulated transitions are kept in a transposition table keyed by a hash of the RAM that describes
+Mario and the visible game area. A transition seen in an earlier decision (the tree of the next
+decision overlaps this one) is replayed from the table instead of the emulator, and two sequences
+that reach the same state in the same search are only expanded once.
+
+With workers the first actions are fanned out across a process pool, each worker owning its own
+emulator clone and table.
+"""
+
+import functools
+import math
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, NamedTuple
+
+import numpy as np
+from ram_map import RamDecoder, RamField
+
+# The RAM that identifies a state for planning, the clock and coin counter are left out so
+# otherwise identical states a few frames apart still match
+KEY_FIELDS: tuple[RamField, ...] = (
+    RamField("lives", 0xDA15),
+    RamField("stage", 0x982E),
+    RamField("world", 0x982C),
+    RamField("dead_timer", 0xFFA6),
+    RamField("dead_jump_timer", 0xC0AC),
+    RamField("game_over", 0xC0A4),
+    RamField("level_block", 0xC0AB),
+    # Mario's whole object slot: his Y (0xC201), X (0xC202) and pose (0xC203) and the jump
+    # and velocity bytes after them, which tell a rising Mario from a falling one
+    RamField("mario", 0xC200, width=16),
+)
+
+RIGHT = 2
+JUMP = 4
+LEFT = 1
+JUMP_RIGHT = 6
+
+# The planner owned by each worker process
+_planner = None
+
+
+class Transition(NamedTuple):
+    key: int
+    value: float
+    terminal: bool
+    state: bytes | None
+
+
+class Planner:
+    """
+    Chooses actions by simulating short action sequences from the current state.
+
+    Args:
+        environment (MarioController): The controller to plan with.
+        actions (tuple): The candidate actions at every step. Defaults to RIGHT, JUMP_RIGHT,
+            JUMP and LEFT.
+        depth (int): The length of the simulated sequences. Defaults to 3.
+        budget (float): The seconds each decision may take. Defaults to 0.05.
+        progress_weight (float): The value of one unit of x_position. Defaults to 1.0.
+        score_weight (float): The value of one point of score. Defaults to 0.1.
+        life_weight (float): The value of each remaining life. Defaults to 500.
+        death_penalty (float): Subtracted from any state where Mario is dying. Defaults to 1000.
+        table_size (int): The number of transitions kept in the transposition table.
+            Defaults to 4096.
+        workers (int): Processes to fan simulations out to, 0 simulates in this process.
+            Defaults to 0.
+        environment_factory (Callable): Builds the emulator clone in each worker. Defaults to a
+            headless MarioController with the same act_freq.
+    """
+
+    def __init__(
+        self,
+        environment,
+        actions: tuple[int, ...] = (RIGHT, JUMP_RIGHT, JUMP, LEFT),
+        depth: int = 3,
+        budget: float = 0.05,
+        progress_weight: float = 1.0,
+        score_weight: float = 0.1,
+        life_weight: float = 500.0,
+        death_penalty: float = 1000.0,
+        table_size: int = 4096,
+        workers: int = 0,
+        environment_factory: Callable | None = None,
+    ) -> None:
+        self.environment = environment
+        self.actions = actions
+        self.depth = depth
+        self.budget = budget
+        self.progress_weight = progress_weight
+        self.score_weight = score_weight
+        self.life_weight = life_weight
+        self.death_penalty = death_penalty
+        self.table_size = table_size
+
+        self.key_decoder = RamDecoder(KEY_FIELDS)
+        self.table: OrderedDict[tuple[int, int], Transition] = OrderedDict()
+
+        self.decisions = 0
+        self.simulations = 0
+        self.table_hits = 0
+        self.transpositions = 0
+        self.depth_reached = 0
+
+        self._pool = None
+        if workers > 0:
+            if environment_factory is None:
+                # Imported here as mario_expert imports this module
+                from mario_expert import (  # pylint: disable=import-outside-toplevel
+                    MarioController,
+                )
+
+                environment_factory = functools.partial(
+                    MarioController, act_freq=environment.act_freq, headless=True
+                )
+            settings = {
+                "actions": actions,
+                "depth": depth,
+                "progress_weight": progress_weight,
+                "score_weight": score_weight,
+                "life_weight": life_weight,
+                "death_penalty": death_penalty,
+                "table_size": table_size,
+            }
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(environment_factory, settings),
+            )
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def plan(self, preferred: int | None = None) -> int | None:
+        """
+        Returns the first action of the best sequence found within the budget, or None if not
+        even one level of the search finished. Ties go to preferred.
+        """
+        deadline = time.monotonic() + self.budget
+        environment = self.environment
+
+        root = environment.capture_state()
+        ticks = environment.ticks
+        render_frames = environment.render_frames
+        # Simulated frames are never shown, so skip rendering them
+        environment.render_frames = False
+        try:
+            if self._pool is None:
+                values = self.search(root, self.actions, deadline)
+            else:
+                values = self._search_parallel(root, deadline)
+        finally:
+            environment.restore_state(root)
+            # Simulated frames were never played
+            environment.ticks = ticks
+            environment.render_frames = render_frames
+        self.decisions += 1
+
+        if not values:
+            return None
+        best = max(values.values())
+        if preferred is not None and values.get(preferred) == best:
+            return preferred
+        return next(action for action in self.actions if values.get(action) == best)
+
+    def search(
+        self, root: bytes, first_actions: tuple[int, ...], deadline: float
+    ) -> dict[int, float]:
+        """
+        Returns the best value reachable after each first action, from the deepest level of the
+        search that finished before deadline.
+        """
+        environment = self.environment
+        environment.restore_state(root)
+        root_key = self._key()
+
+        # Each node is (state, key, first action, value, terminal)
+        frontier = [(root, root_key, None, 0.0, False)]
+        seen = {root_key}
+        values: dict[int, float] = {}
+
+        for depth in range(self.depth):
+            last_level = depth == self.depth - 1
+            level: dict[int, float] = {}
+            expanded = []
+
+            for state, key, first, value, terminal in frontier:
+                if terminal:
+                    # Dead ends and transpositions keep their value at every later level
+                    level[first] = max(level.get(first, -math.inf), value)
+                    expanded.append((state, key, first, value, terminal))
+                    continue
+
+                for action in first_actions if first is None else self.actions:
+                    if time.monotonic() > deadline:
+                        return values
+
+                    child = self._transition(state, key, action, capture=not last_level)
+                    first_action = action if first is None else first
+                    level[first_action] = max(
+                        level.get(first_action, -math.inf), child.value
+                    )
+
+                    if child.key in seen:
+                        self.transpositions += 1
+                        expanded.append(
+                            (None, child.key, first_action, child.value, True)
+                        )
+                        continue
+                    seen.add(child.key)
+                    expanded.append(
+                        (
+                            child.state,
+                            child.key,
+                            first_action,
+                            child.value,
+                            child.terminal,
+                        )
+                    )
+
+            values = level
+            frontier = expanded
+            self.depth_reached = max(self.depth_reached, depth + 1)
+
+        return values
+
+    def _search_parallel(self, root: bytes, deadline: float) -> dict[int, float]:
+        futures = {
+            action: self._pool.submit(_search_subtree, root, action, deadline)
+            for action in self.actions
+        }
+        values = {}
+        for action, future in futures.items():
+            result = future.result()
+            if action in result:
+                values[action] = result[action]
+        # A first action whose subtree did not finish a single level cannot be compared
+        return values if len(values) == len(self.actions) else {}
+
+    def _transition(
+        self, state: bytes, key: int, action: int, capture: bool
+    ) -> Transition:
+        cached = self.table.get((key, action))
+        if cached is not None and (
+            cached.state is not None or cached.terminal or not capture
+        ):
+            self.table.move_to_end((key, action))
+            self.table_hits += 1
+            return cached
+
+        environment = self.environment
+        environment.restore_state(state)
+        environment.apply_action(action)
+        self.simulations += 1
+
+        observation = environment.observe()
+        state = observation.state
+        terminal = bool(
+            state["dead_timer"] or state["dead_jump_timer"] or state["game_over"]
+        )
+        value = (
+            self.progress_weight * observation.x_position
+            + self.score_weight * state["score"]
+            + self.life_weight * state["lives"]
+            - (self.death_penalty if terminal else 0.0)
+        )
+        child = Transition(
+            self._key(),
+            value,
+            terminal,
+            environment.capture_state() if capture and not terminal else None,
+        )
+
+        self.table[(key, action)] = child
+        if len(self.table) > self.table_size:
+            self.table.popitem(last=False)
+        return child
+
+    def _key(self) -> int:
+        observation = self.environment.observe()
+        ram = self.key_decoder.snapshot(self.environment.pyboy.memory)
+        return hash((ram.data, np.asarray(observation.game_area).tobytes()))
+
+
+def _init_worker(environment_factory: Callable, settings: dict) -> None:
+    global _planner  # pylint: disable=global-statement
+    environment = environment_factory()
+    environment.pyboy.set_emulation_speed(0)
+    environment.reset()
+    _planner = Planner(environment, **settings)
+    environment.render_frames = False
+
+
+def _search_subtree(root: bytes, action: int, deadline: float) -> dict[int, float]:
+    return _planner.search(root, (action,), deadline)
@@ -1,63 +1,82 @@
+import argparse
+import logging
 import os
-import subprocess
 from pathlib import Path
 
-import virtualenv
-from pydrive2.auth import GoogleAuth
-from pydrive2.drive import GoogleDrive
+from job_scheduler import Job, JobScheduler
+from submission_sources import DriveSource, LocalSource, sync_submissions
+from venv_cache import VenvCache
+
+logging.basicConfig(level=logging.INFO)
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("--source", choices=["drive", "local"], default="drive")
+    parse_args.add_argument(
+        "--path", type=str, help="Directory of <upi> folders for --source local"
+    )
+    parse_args.add_argument(
+        "--fetch_workers", type=int, default=8, help="Concurrent downloads"
+    )
+
+    parse_args.add_argument("--workers", type=int, default=os.cpu_count())
+    parse_args.add_argument(
+        "--timeout", type=float, default=3600, help="Wall-clock seconds per run"
+    )
+    parse_args.add_argument(
+        "--stall_timeout",
+        type=float,
+        default=600,
+        help="Seconds without its video, results or log growing before a run is killed, "
+        "0 disables",
+    )
+    parse_args.add_argument("--retries", type=int, default=1)
+    parse_args.add_argument(
+        "--build_workers", type=int, default=4, help="Concurrent environment builds"
+    )
+    parse_args.add_argument(
+        "--offline",
+        action="store_true",
+        help="Install only from the local wheel cache",
+    )
+
+    return parse_args.parse_args()
+
+
+def build_job(upi, python_bin, workspace):
+    scripts_path = f"{Path(__file__).parent}"
+
+    # Running run.py as a module from the workspace puts the submission's mario_expert.py first on
+    # sys.path, while the rest of the framework is still found through PYTHONPATH. Only the
+    # overrides go on the job, it is saved to the queue file
+    env = {
+        "PYTHONPATH": os.pathsep.join(
+            filter(None, [scripts_path, os.environ.get("PYTHONPATH")])
+        ),
+        "PYTHONUNBUFFERED": "1",
+    }
+
+    return Job(
+        name=upi,
+        command=[python_bin, "-m", "run", "--upi", upi, "--headless"],
+        results_path=f"{Path(__file__).parent.parent}/results/{upi}",
+        cwd=workspace,
+        env=env,
+    )
+
+
+def get_source(args):
+    if args.source == "local":
+        if args.path is None:
+            raise ValueError("--path is required for --source local")
+        return LocalSource(args.path)
+
+    # Only needed for Drive, so grading from a local directory works offline
+    from pydrive2.auth import GoogleAuth
+    from pydrive2.drive import GoogleDrive
 
-
-def read_folder(drive, title, file_id):
-    folder = {}
-
-    folder["title"] = title
-    folder["files"] = {}
-    folder["folders"] = []
-
-    drive_list = drive.ListFile(
-        {"q": f"'{file_id}' in parents and trashed=false"}
-    ).GetList()
-
-    for f in drive_list:
-        if f["mimeType"] == "application/vnd.google-apps.folder":
-            folder["folders"].append(read_folder(drive, f["title"], f["id"]))
-        else:
-            folder["files"][f["title"]] = {
-                "id": f["id"],
-                "title": f["title"],
-                "title1": f["alternateLink"],
-            }
-
-    return folder
-
-
-def print_folders(directory, tab=0):
-    tabs = " " * tab
-
-    for _, file in directory["files"].items():
-        message = f"{tabs}File: {file['title']}, id: {file['id']}"
-        print(f"{message}")
-
-    for folder in directory["folders"]:
-        message = f"{tabs}Folder: {folder['title']}"
-        print(f"{message}")
-        print_folders(folder, tab=tab + 5)
-
-
-def run_venv(upi, requirement_path):
-    path = f"{os.path.expanduser('~')}/venv"
-    venv_dir = os.path.join(path, f"{upi}")
-    virtualenv.cli_run([venv_dir])
-
-    python_bin = f"{path}/{upi}/bin/python3"
-
-    command = f". {venv_dir}/bin/activate && pip install -r {requirement_path}/requirements.txt"
-    os.system(command)
-
-    return subprocess.Popen([python_bin, "run.py", "--upi", upi, "--headless"])
-
-
-def main():
     gauth = GoogleAuth()
     gauth.LocalWebserverAuth()
 
@@ -66,33 +85,60 @@ def main():
     # COMPSYS726 - Assignment 1 Folder
     primary_folder_id = "1xM3Dhtm3YCoLnMFTMxyZnhJVvHsYbFgn"
 
-    directory = read_folder(drive, "COMPSYS726 - Assignments", primary_folder_id)
-
-    print_folders(directory)
+    return DriveSource(drive, primary_folder_id, workers=args.fetch_workers)
 
-    sub_processes = {}
-    for folders in directory["folders"]:
-        upi = folders["title"]
-        print(f"Title: {upi}")
 
-        files = folders["files"]
-        requirements_id = files["requirements.txt"]["id"]
-        mario_expert_id = files["mario_expert.py"]["id"]
-
-        requirement_path = f"{Path(__file__).parent.parent}"
-
-        file = drive.CreateFile({"id": requirements_id})
-        file.GetContentFile(f"{requirement_path}/requirements.txt")
-
-        file = drive.CreateFile({"id": mario_expert_id})
-        file.GetContentFile("mario_expert.py")
-
-        p = run_venv(upi, requirement_path)
-        sub_processes[upi] = p
-
-    for upi, p in sub_processes.items():
-        exit_code = p.wait()
-        print(f"Exit code: {exit_code} {upi}")
+def main():
+    args = get_args()
+
+    source = get_source(args)
+
+    root_path = f"{Path(__file__).parent.parent}"
+    scheduler = JobScheduler(
+        f"{root_path}/results/queue.json",
+        workers=args.workers,
+        timeout=args.timeout,
+        stall_timeout=args.stall_timeout,
+        retries=args.retries,
+    )
+
+    venv_cache = VenvCache(workers=args.build_workers, offline=args.offline)
+
+    environments = {}
+
+    def build_environment(submission):
+        # Builds run in the background while the remaining submissions download
+        environments[submission.upi] = (
+            venv_cache.submit(f"{submission.workspace}/requirements.txt"),
+            submission,
+        )
+
+    # Each submission gets its own workspace so queued runs never see another student's code
+    sync_submissions(
+        source,
+        f"{root_path}/submissions",
+        workers=args.fetch_workers,
+        on_synced=build_environment,
+    )
+
+    for upi, (environment, submission) in sorted(environments.items()):
+        try:
+            python_bin = environment.result()
+        except RuntimeError as error:
+            logging.error(f"Could not build the environment for {upi}: {error}")
+            continue
+        # Only new or changed submissions are re-run if an earlier batch already graded them
+        scheduler.add(
+            build_job(upi, python_bin, submission.workspace), force=submission.changed
+        )
+
+    venv_cache.shutdown()
+
+    jobs = scheduler.run()
+
+    for upi, job in jobs.items():
+        exit_code = job.history[-1]["exit_code"] if job.history else None
+        print(f"Exit code: {exit_code} {upi} ({job.state})")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,6 @@
 from abc import ABCMeta
 from pathlib import Path
 
-import cv2
 import numpy as np
 from pyboy import PyBoy
 
@@ -41,6 +40,9 @@ class PyboyEnvironment(metaclass=ABCMeta):
         self.reset()
 
     def grab_frame(self, height: int = 240, width: int = 300) -> np.ndarray:
+        # Imported here so runs that never capture a frame never load OpenCV
+        import cv2  # pylint: disable=import-outside-toplevel
+
         frame = np.array(self.screen.ndarray)
         frame = cv2.resize(frame, (width, height))
         # Convert to BGR for use with OpenCV
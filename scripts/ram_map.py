@@ -0,0 +1,135 @@
+"""
+Declarative RAM map for Super Mario Land and a compiled decoder for it.
+
+Each field is described once by its address and encoding. RamDecoder compiles the table into
+the list of byte addresses it covers, reads them all with a single itemgetter over the memory
+view and then decodes every field with plain integer operations.
+
+https://datacrystal.tcrf.net/wiki/Super_Mario_Land/RAM_map
+"""
+
+import operator
+from typing import NamedTuple
+
+
+class RamField(NamedTuple):
+    """
+    A single value in the game RAM.
+
+    Args:
+        name (str): The key the decoded value is returned under.
+        address (int): The first address of the field.
+        encoding (str): One of raw, bcd, bit, triple, digits or equals.
+        width (int): The number of bytes the field spans. Defaults to 1.
+        arg (int): The bit index for bit fields or the value compared against for equals fields.
+    """
+
+    name: str
+    address: int
+    encoding: str = "raw"
+    width: int = 1
+    arg: int = 0
+
+
+MARIO_FIELDS: tuple[RamField, ...] = (
+    RamField("lives", 0xDA15),
+    RamField("coins", 0xFFFA),
+    RamField("stage", 0x982E),
+    RamField("world", 0x982C),
+    RamField("time", 0x9831, "digits", width=3),
+    RamField("dead_timer", 0xFFA6),
+    RamField("dead_jump_timer", 0xC0AC),
+    RamField("game_over", 0xC0A4, "equals", arg=0x39),
+    RamField("mario_pose", 0xC203),
+    RamField("mario_x", 0xC202),
+    RamField("level_block", 0xC0AB),
+)
+
+# Decimal place value of each byte when its str() is concatenated - see MarioEnvironment.get_time
+_DIGIT_SCALE = tuple(10 if v < 10 else 100 if v < 100 else 1000 for v in range(256))
+
+
+class RamSnapshot:
+    """
+    The bytes of every address of a RamDecoder, read at one point in time.
+
+    Args:
+        decoder (RamDecoder): The decoder that produced the snapshot.
+        data (tuple): The byte at each of the decoder's addresses.
+    """
+
+    def __init__(self, decoder: "RamDecoder", data: tuple[int, ...]) -> None:
+        self.decoder = decoder
+        self.data = data
+
+    def decode(self) -> dict[str, int | bool]:
+        return self.decoder.decode(self.data)
+
+    def read(self, address: int) -> int:
+        """
+        Returns the byte at address, which must be one of the decoder's addresses.
+        """
+        return self.data[self.decoder.offset(address)]
+
+
+class RamDecoder:
+    """
+    Reads a table of RamFields with one lookup per byte they cover.
+
+    Copying whole regions with memory[start:end] costs far more than the handful of single
+    byte reads Mario needs, so every byte is read on its own.
+
+    Args:
+        fields (tuple): The fields to decode. Defaults to MARIO_FIELDS.
+    """
+
+    def __init__(self, fields: tuple[RamField, ...] = MARIO_FIELDS) -> None:
+        self.fields = fields
+
+        self.addresses = sorted({f.address + i for f in fields for i in range(f.width)})
+        self._offsets = {address: i for i, address in enumerate(self.addresses)}
+        self._getter = operator.itemgetter(*self.addresses)
+
+        self._program = [
+            (f.name, f.encoding, self.offset(f.address), f.width, f.arg) for f in fields
+        ]
+
+    def offset(self, address: int) -> int:
+        try:
+            return self._offsets[address]
+        except KeyError:
+            raise KeyError(
+                f"Address {address:#06x} is not covered by this decoder"
+            ) from None
+
+    def snapshot(self, memory) -> RamSnapshot:
+        """
+        Reads every address out of a PyBoy memory view.
+        """
+        data = self._getter(memory)
+        # itemgetter returns the bare value when there is a single address
+        if len(self.addresses) == 1:
+            data = (data,)
+        return RamSnapshot(self, data)
+
+    def decode(self, data: tuple[int, ...]) -> dict[str, int | bool]:
+        values: dict[str, int | bool] = {}
+        for name, encoding, offset, width, arg in self._program:
+            value = data[offset]
+            if encoding == "raw":
+                pass
+            elif encoding == "bcd":
+                value = 10 * ((value >> 4) & 0x0F) + (value & 0x0F)
+            elif encoding == "bit":
+                value = bool((value >> arg) & 1)
+            elif encoding == "equals":
+                value = value == arg
+            elif encoding == "triple":
+                value = (value << 16) | (data[offset + 1] << 8) | data[offset + 2]
+            elif encoding == "digits":
+                for byte in data[offset + 1 : offset + width]:
+                    value = value * _DIGIT_SCALE[byte] + byte
+            else:
+                raise ValueError(f"Unknown encoding {encoding} for field {name}")
+            values[name] = value
+        return values
@@ -0,0 +1,170 @@
+"""
+Regenerates the video and results of episodes from their action logs.
+
+Each actions.json written by play() is replayed headless at unlimited emulation speed from the
+savestate it started from, on a pool of warm emulators. The video can be rendered at any size
+and, with --every_frame, with every emulated frame instead of one per action. The replayed
+results are checked against the ones recorded with the log.
+
+python3 replay.py ../results/my_sweep/*/actions.json --workers 8 --width 640 --height 576
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+
+from action_log import ActionLog, state_hash
+
+logging.basicConfig(level=logging.INFO)
+
+# The warm controller and known starting states owned by each worker process
+_controller = None
+_states: dict[str, bytes] = {}
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("logs", type=str, nargs="+")
+    parse_args.add_argument("--workers", type=int, default=os.cpu_count())
+    parse_args.add_argument("--width", type=int, default=300)
+    parse_args.add_argument("--height", type=int, default=240)
+    parse_args.add_argument("--fps", type=int, default=30)
+    parse_args.add_argument(
+        "--every_frame",
+        action="store_true",
+        help="Write every emulated frame instead of one per action",
+    )
+    parse_args.add_argument(
+        "--states",
+        type=str,
+        nargs="*",
+        default=[],
+        help="Savestate files episodes may have started from besides init.state",
+    )
+    parse_args.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Directory to write to, defaults to next to each log",
+    )
+    parse_args.add_argument("--backend", choices=["rom", "stub"], default="rom")
+
+    return parse_args.parse_args()
+
+
+def _init_worker(backend: str, state_files: list[str]) -> None:
+    # Imported here so the parent process never loads the emulator
+    # pylint: disable=import-outside-toplevel
+    from mario_expert import MarioController
+    from stub_emulator import stub_backend
+
+    global _controller  # pylint: disable=global-statement
+    if backend == "stub":
+        with stub_backend():
+            _controller = MarioController(headless=True)
+    else:
+        _controller = MarioController(headless=True)
+    _controller.pyboy.set_emulation_speed(0)
+
+    initial = _controller.savestates.file_initial
+    _states[state_hash(initial)] = initial
+    for path in state_files:
+        with open(path, "rb") as file:
+            state = file.read()
+        _states[state_hash(state)] = state
+
+
+def replay(job: dict) -> dict:
+    # Imported here so the parent process never loads OpenCV
+    from video_encoder import (  # pylint: disable=import-outside-toplevel
+        AsyncVideoWriter,
+    )
+
+    log = ActionLog.load(job["log"])
+    output = job["output"]
+    os.makedirs(output, exist_ok=True)
+
+    state = _states.get(log.start_hash)
+    if state is None:
+        return {**job, "error": f"unknown starting state {log.start_hash[:16]}"}
+
+    controller = _controller
+    pyboy = controller.pyboy
+    controller.act_freq = log.act_freq
+    # Start the way play() did, reset settles a frame after loading the state
+    controller.savestates.set_initial(state)
+    controller.reset()
+
+    video = AsyncVideoWriter(
+        f"{output}/mario_expert.mp4", job["width"], job["height"], fps=job["fps"]
+    )
+    try:
+        for action in log.actions():
+            if job["every_frame"]:
+                controller.press(action)
+                for _ in range(log.act_freq):
+                    pyboy.tick(1, True)
+                    video.write_screen(pyboy.screen.ndarray)
+                controller.release(action)
+            else:
+                video.write_screen(pyboy.screen.ndarray)
+                controller.apply_action(action)
+    finally:
+        video.release()
+
+    results = controller.game_state()
+    with open(f"{output}/results.json", "w", encoding="utf-8") as file:
+        json.dump(results, file)
+
+    return {**job, "results": results, "matches": results == log.results}
+
+
+def main():
+    args = get_args()
+
+    jobs = []
+    for path in args.logs:
+        output = os.path.dirname(os.path.abspath(path))
+        if args.output:
+            output = f"{args.output}/{os.path.basename(output)}"
+        jobs.append(
+            {
+                "log": path,
+                "output": output,
+                "width": args.width,
+                "height": args.height,
+                "fps": args.fps,
+                "every_frame": args.every_frame,
+            }
+        )
+
+    workers = max(1, min(args.workers, len(jobs)))
+    logging.info(f"Replaying {len(jobs)} logs on {workers} workers")
+
+    failures = 0
+    with multiprocessing.Pool(
+        processes=workers,
+        initializer=_init_worker,
+        initargs=(args.backend, args.states),
+    ) as pool:
+        for result in pool.imap_unordered(replay, jobs):
+            if "error" in result:
+                failures += 1
+                logging.error(f"{result['log']}: {result['error']}")
+            elif not result["matches"]:
+                failures += 1
+                logging.error(
+                    f"{result['log']}: replay diverged, got {result['results']}"
+                )
+            else:
+                logging.info(f"{result['log']}: {result['output']}/mario_expert.mp4")
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
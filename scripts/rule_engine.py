@@ -0,0 +1,253 @@
+"""
+A declarative, indexed rule engine for choosing actions from a game area.
+
+A Rule names an action, the entity classes that must be present (requires) or absent (excludes)
+for it to apply, a priority and a conjunction of conditions over cells and entities relative to
+Mario. Alternatives are written as separate rules with the same action and priority.
+
+Rules are indexed by the entity classes they depend on. For each distinct set of classes on
+screen the engine builds, once, the list of rules that can apply, ordered by priority. A decision
+walks that list until the first rule whose conditions hold, and every condition is evaluated at
+most once per decision however many rules share it. The cost of a decision therefore depends on
+the rules relevant to what is on screen, not on the size of the rule base.
+"""
+
+import operator
+from dataclasses import dataclass
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+_COMPARISONS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+class Condition:
+    """
+    This is a base class for the tests a rule can make. Conditions are frozen dataclasses, so
+    equal conditions compare and hash equal and are shared between rules.
+    """
+
+    def evaluate(self, game_area: np.ndarray, entities, mario: tuple[int, int]) -> bool:
+        raise NotImplementedError
+
+
+@dataclass(frozen=True)
+class MarioAt(Condition):
+    """
+    Mario's row (axis 0) or column (axis 1) equals value.
+    """
+
+    axis: int
+    value: int
+
+    def evaluate(self, game_area, entities, mario) -> bool:
+        return mario[self.axis] == self.value
+
+
+@dataclass(frozen=True)
+class Cell(Condition):
+    """
+    The cell at (d_row, d_col) from Mario compares to value, != when negate is set.
+
+    row fixes the row instead of offsetting it from Mario. Cells outside the game area read as 0.
+    """
+
+    d_row: int
+    d_col: int
+    value: int
+    negate: bool = False
+    row: int | None = None
+
+    def evaluate(self, game_area, entities, mario) -> bool:
+        row = self.row if self.row is not None else mario[0] + self.d_row
+        col = mario[1] + self.d_col
+        rows, cols = game_area.shape
+        cell = game_area[row, col] if 0 <= row < rows and 0 <= col < cols else 0
+        return (cell != self.value) if self.negate else (cell == self.value)
+
+
+@dataclass(frozen=True)
+class InRow(Condition):
+    """
+    An entity of class value is in the row d_row from Mario.
+    """
+
+    value: int
+    d_row: int = 0
+
+    def evaluate(self, game_area, entities, mario) -> bool:
+        row = mario[0] + self.d_row
+        return 0 <= row < entities.rows and entities.in_row(self.value, row)
+
+
+@dataclass(frozen=True)
+class InColumn(Condition):
+    """
+    An entity of class value is in the column d_col from Mario.
+    """
+
+    value: int
+    d_col: int = 0
+
+    def evaluate(self, game_area, entities, mario) -> bool:
+        col = mario[1] + self.d_col
+        return 0 <= col < entities.cols and entities.in_column(self.value, col)
+
+
+@dataclass(frozen=True)
+class Offset(Condition):
+    """
+    The first entity of class value, less Mario, along axis compares to threshold.
+
+    Offset(CHIBIBO, 0, ">", 0) is "the goomba is below Mario", Offset(CHIBIBO, 1, ">", 3) is
+    "the goomba is more than three columns ahead".
+    """
+
+    value: int
+    axis: int
+    comparison: str
+    threshold: int
+
+    def evaluate(self, game_area, entities, mario) -> bool:
+        position = entities.first(self.value)
+        if position is None:
+            return False
+        difference = position[self.axis] - mario[self.axis]
+        return _COMPARISONS[self.comparison](difference, self.threshold)
+
+
+@dataclass(frozen=True)
+class Predicate(Condition):
+    """
+    An arbitrary test, for conditions the declarative ones cannot express.
+
+    Predicates are shared when they wrap the same function.
+    """
+
+    name: str
+    function: Callable
+
+    def evaluate(self, game_area, entities, mario) -> bool:
+        return bool(self.function(game_area, entities, mario))
+
+
+class Rule(NamedTuple):
+    action: int
+    conditions: tuple[Condition, ...] = ()
+    requires: tuple[int, ...] = ()
+    excludes: tuple[int, ...] = ()
+    priority: int = 0
+    name: str = ""
+
+
+class RuleEngine:
+    """
+    Chooses the action of the highest priority rule whose requirements and conditions hold.
+
+    Ties in priority go to the rule declared first.
+
+    Args:
+        rules (list[Rule]): The rule base.
+        default (int): The action when no rule applies. Defaults to 0.
+        cache_size (int): The number of entity sets whose candidate rules are kept.
+            Defaults to 1024.
+    """
+
+    def __init__(self, rules: list[Rule], default: int = 0, cache_size: int = 1024):
+        self.rules = list(rules)
+        self.default = default
+        self.cache_size = cache_size
+
+        # Intern conditions so each distinct one has a slot in the per-decision memo
+        self._condition_ids: dict[Condition, int] = {}
+        self._rule_conditions: list[tuple[int, ...]] = []
+        for rule in self.rules:
+            ids = []
+            for condition in rule.conditions:
+                if condition not in self._condition_ids:
+                    self._condition_ids[condition] = len(self._condition_ids)
+                ids.append(self._condition_ids[condition])
+            self._rule_conditions.append(tuple(ids))
+        self._conditions = list(self._condition_ids)
+
+        # A memo slot is valid only when its generation matches the current decision's
+        self._values = [False] * len(self._conditions)
+        self._generations = [0] * len(self._conditions)
+        self._generation = 0
+
+        # Every rule is filed under one class it requires, rules requiring none are always tried
+        self.classes = frozenset(
+            value for rule in self.rules for value in rule.requires + rule.excludes
+        )
+        self._by_class: dict[int, list[int]] = {}
+        self._unconditional: list[int] = []
+        for index, rule in enumerate(self.rules):
+            if rule.requires:
+                self._by_class.setdefault(rule.requires[0], []).append(index)
+            else:
+                self._unconditional.append(index)
+
+        self._candidates: dict[frozenset, list[int]] = {}
+        self.last_rule: Rule | None = None
+
+    def candidates(self, present: frozenset) -> list[int]:
+        """
+        Returns the indices of the rules that can apply when exactly present is on screen,
+        highest priority first.
+        """
+        cached = self._candidates.get(present)
+        if cached is not None:
+            return cached
+
+        indices = list(self._unconditional)
+        for value in present:
+            indices.extend(self._by_class.get(value, ()))
+
+        candidates = []
+        for index in indices:
+            rule = self.rules[index]
+            if all(value in present for value in rule.requires) and not any(
+                value in present for value in rule.excludes
+            ):
+                candidates.append(index)
+        candidates.sort(key=lambda index: (-self.rules[index].priority, index))
+
+        if len(self._candidates) >= self.cache_size:
+            self._candidates.clear()
+        self._candidates[present] = candidates
+        return candidates
+
+    def decide(self, game_area: np.ndarray, entities, mario: tuple[int, int]) -> int:
+        """
+        Returns the chosen action for a game area, its EntityIndex and Mario's position.
+        """
+        present = self.classes.intersection(entities.present())
+
+        self._generation += 1
+        generation = self._generation
+        values = self._values
+        generations = self._generations
+        conditions = self._conditions
+
+        for index in self.candidates(present):
+            for condition_id in self._rule_conditions[index]:
+                if generations[condition_id] != generation:
+                    generations[condition_id] = generation
+                    values[condition_id] = conditions[condition_id].evaluate(
+                        game_area, entities, mario
+                    )
+                if not values[condition_id]:
+                    break
+            else:
+                self.last_rule = self.rules[index]
+                return self.last_rule.action
+
+        self.last_rule = None
+        return self.default
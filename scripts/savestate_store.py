@@ -0,0 +1,110 @@
+"""
+In-memory savestates for PyBoy.
+
+The initial state is read from disk once and every later reset restores from memory. Named or
+automatic checkpoints are kept in a size-bounded LRU pool so a run can jump back to any recent
+point without replaying the level from the start.
+"""
+
+import io
+import logging
+from collections import OrderedDict
+
+
+class SavestateStore:
+    """
+    A pool of in-memory PyBoy savestates.
+
+    Args:
+        pyboy (PyBoy): The emulator to save and restore.
+        init_path (str): The savestate file restored by reset.
+        max_bytes (int): The total size the checkpoint pool may grow to. Defaults to 64 MiB.
+        initial (bytes): The state restored by reset, read from init_path if not given.
+    """
+
+    INIT = "init"
+
+    def __init__(
+        self,
+        pyboy,
+        init_path: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        initial: bytes | None = None,
+    ) -> None:
+        self.pyboy = pyboy
+        self.max_bytes = max_bytes
+
+        if initial is None:
+            with open(init_path, "rb") as file:
+                initial = file.read()
+        self.file_initial = initial
+        self.initial = self.file_initial
+
+        self._checkpoints: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+
+    def restore_initial(self) -> None:
+        self.pyboy.load_state(io.BytesIO(self.initial))
+
+    def set_initial(self, state: bytes | None) -> None:
+        """
+        Changes the state restored by reset, None goes back to the state loaded from disk.
+        """
+        self.initial = self.file_initial if state is None else state
+
+    def capture(self) -> bytes:
+        """
+        Returns the current emulator state as bytes without adding it to the pool.
+        """
+        buffer = io.BytesIO()
+        self.pyboy.save_state(buffer)
+        return buffer.getvalue()
+
+    def restore_bytes(self, state: bytes) -> None:
+        self.pyboy.load_state(io.BytesIO(state))
+
+    def save(self, name: str) -> bytes:
+        """
+        Captures the current state into the pool under name, evicting the least recently used
+        checkpoints if the pool is over its size budget.
+        """
+        state = self.capture()
+
+        if name in self._checkpoints:
+            self._size -= len(self._checkpoints.pop(name))
+        self._checkpoints[name] = state
+        self._size += len(state)
+
+        while self._size > self.max_bytes and len(self._checkpoints) > 1:
+            evicted, old = self._checkpoints.popitem(last=False)
+            self._size -= len(old)
+            logging.debug(f"Evicted checkpoint {evicted}")
+
+        return state
+
+    def restore(self, name: str) -> None:
+        if name == self.INIT:
+            self.restore_initial()
+            return
+
+        state = self._checkpoints[name]
+        self._checkpoints.move_to_end(name)
+        self.restore_bytes(state)
+
+    def discard(self, name: str) -> None:
+        state = self._checkpoints.pop(name, None)
+        if state is not None:
+            self._size -= len(state)
+
+    def clear(self) -> None:
+        self._checkpoints.clear()
+        self._size = 0
+
+    def names(self) -> list[str]:
+        return list(self._checkpoints)
+
+    def __contains__(self, name: str) -> bool:
+        return name == self.INIT or name in self._checkpoints
+
+    def __len__(self) -> int:
+        return len(self._checkpoints)
@@ -0,0 +1,206 @@
+"""
+Live observations published through shared memory.
+
+Each running agent owns a multiprocessing.shared_memory block named mario-<name> holding a small
+ring of slots. Every step the publisher copies the screen, game area and game state fields into
+the next slot under a seqlock: the slot's sequence number is odd while it is being written and
+even once it is complete. Readers copy the latest slot and retry if the sequence changed under
+them, so any number of monitors can watch without locks, pickling, sockets or re-encoding, and
+never slow the agent down.
+"""
+
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import NamedTuple
+
+import numpy as np
+from vec_environment import GAME_AREA_SHAPE, STATE_DTYPE
+
+PREFIX = "mario-"
+SCREEN_SHAPE = (144, 160, 4)
+
+_MAGIC = b"MARIOOBS"
+_HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("slots", np.uint32),
+        ("pid", np.uint32),
+        ("published", np.uint64),
+    ],
+    align=True,
+)
+_SLOT_DTYPE = np.dtype(
+    [
+        ("sequence", np.uint64),
+        ("frame", np.uint64),
+        ("time", np.float64),
+        ("screen", np.uint8, SCREEN_SHAPE),
+        ("game_area", np.uint8, GAME_AREA_SHAPE),
+        ("state", STATE_DTYPE),
+    ],
+    align=True,
+)
+
+
+class SharedObservation(NamedTuple):
+    name: str
+    pid: int
+    published: int
+    frame: int
+    time: float
+    screen: np.ndarray
+    game_area: np.ndarray
+    state: dict
+
+
+def _views(buffer, slots: int) -> tuple[np.ndarray, np.ndarray]:
+    header = np.ndarray((1,), dtype=_HEADER_DTYPE, buffer=buffer)
+    ring = np.ndarray(
+        (slots,), dtype=_SLOT_DTYPE, buffer=buffer, offset=_HEADER_DTYPE.itemsize
+    )
+    return header, ring
+
+
+class ObservationPublisher:
+    """
+    Publishes one agent's observations to a shared memory ring.
+
+    Args:
+        name (str): Identifies the agent, the block is named mario-<name>.
+        slots (int): The number of observations in the ring. Defaults to 4.
+    """
+
+    def __init__(self, name: str, slots: int = 4) -> None:
+        self.name = name
+        self.slots = slots
+
+        size = _HEADER_DTYPE.itemsize + slots * _SLOT_DTYPE.itemsize
+        try:
+            self.memory = shared_memory.SharedMemory(
+                f"{PREFIX}{name}", create=True, size=size
+            )
+        except FileExistsError:
+            # Left behind by an agent that was killed, nothing can still be writing to it
+            stale = shared_memory.SharedMemory(f"{PREFIX}{name}")
+            stale.close()
+            stale.unlink()
+            self.memory = shared_memory.SharedMemory(
+                f"{PREFIX}{name}", create=True, size=size
+            )
+
+        self._header, self._ring = _views(self.memory.buf, slots)
+        self._ring["sequence"] = 0
+        self._header["slots"] = slots
+        self._header["pid"] = os.getpid()
+        self._header["published"] = 0
+        self._header["magic"] = _MAGIC
+        self._published = 0
+
+    def publish(
+        self, frame: int, screen: np.ndarray, game_area: np.ndarray, state: dict
+    ) -> None:
+        index = self._published % self.slots
+        ring = self._ring
+
+        # Odd while writing, readers that see it (or see it change) discard what they copied
+        ring["sequence"][index] += 1
+        ring["frame"][index] = frame
+        ring["time"][index] = time.time()
+        ring["screen"][index] = screen
+        ring["game_area"][index] = game_area
+        ring["state"][index] = tuple(state[name] for name in STATE_DTYPE.names)
+        ring["sequence"][index] += 1
+
+        self._published += 1
+        self._header["published"] = self._published
+
+    def close(self) -> None:
+        if self.memory is None:
+            return
+        # Drop the views before closing, the mapping cannot close while they exist
+        self._header = self._ring = None
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+
+class ObservationSubscriber:
+    """
+    Reads the latest observation an ObservationPublisher has published.
+
+    Args:
+        name (str): The name the publisher was created with.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.memory = shared_memory.SharedMemory(f"{PREFIX}{name}")
+        # Attaching registers the block for cleanup at exit, which would unlink it from under
+        # the publisher - the publisher alone owns it
+        resource_tracker.unregister(
+            self.memory._name, "shared_memory"  # pylint: disable=protected-access
+        )
+
+        header = np.ndarray((1,), dtype=_HEADER_DTYPE, buffer=self.memory.buf)
+        if header["magic"][0] != _MAGIC:
+            self.memory.close()
+            raise ValueError(f"{PREFIX}{name} is not an observation ring")
+        self.slots = int(header["slots"][0])
+        self.pid = int(header["pid"][0])
+        self._header, self._ring = _views(self.memory.buf, self.slots)
+
+    def latest(self, retries: int = 8) -> SharedObservation | None:
+        """
+        Returns a consistent copy of the newest observation, or None if nothing has been
+        published yet or every attempt raced with the publisher.
+        """
+        header = self._header
+        ring = self._ring
+
+        for _ in range(retries):
+            published = int(header["published"][0])
+            if published == 0:
+                return None
+            index = (published - 1) % self.slots
+
+            before = int(ring["sequence"][index])
+            if before & 1:
+                continue
+            frame = int(ring["frame"][index])
+            timestamp = float(ring["time"][index])
+            screen = ring["screen"][index].copy()
+            game_area = ring["game_area"][index].copy()
+            state = ring["state"][index].copy()
+            if int(ring["sequence"][index]) != before:
+                continue
+
+            return SharedObservation(
+                self.name,
+                self.pid,
+                published,
+                frame,
+                timestamp,
+                screen,
+                game_area,
+                {name: state[name].item() for name in STATE_DTYPE.names},
+            )
+        return None
+
+    def close(self) -> None:
+        if self.memory is None:
+            return
+        self._header = self._ring = None
+        self.memory.close()
+        self.memory = None
+
+
+def list_publishers(path: str = "/dev/shm") -> list[str]:
+    """
+    Returns the names of every observation ring on this machine.
+    """
+    try:
+        entries = os.listdir(path)
+    except FileNotFoundError:
+        return []
+    return sorted(entry[len(PREFIX) :] for entry in entries if entry.startswith(PREFIX))
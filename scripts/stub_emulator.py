@@ -0,0 +1,326 @@
+"""
+A stand-in for PyBoy running a small synthetic Super Mario Land level.
+
+It implements just the parts of the PyBoy API the framework uses (tick, send_input, memory,
+screen, game_wrapper and save/load state) and writes the same RAM addresses the game does, so the
+controller, the expert and the benchmarks can run on machines without the ROM. The level is
+deterministic - ground with gaps, pipes and walking enemies - which keeps timings comparable.
+
+with stub_backend():
+    expert = MarioExpert(results_path, headless=True)
+"""
+
+import contextlib
+import pickle
+
+import numpy as np
+import pyboy_environment
+from pyboy.utils import WindowEvent
+
+GROUND = 10
+PIPE = 14
+ENEMY = 15
+MARIO = 1
+
+SCREEN_ROWS = 16
+SCREEN_COLS = 20
+
+_JUMP_FRAMES = 24
+_EVENT_NAMES = {
+    int(getattr(WindowEvent, name)): name
+    for name in dir(WindowEvent)
+    if name.startswith(("PRESS_", "RELEASE_"))
+}
+_PALETTE = np.array(
+    [[255, 255, 255, 255]]
+    + [[(37 * i) % 256, (91 * i) % 256, (53 * i) % 256, 255] for i in range(1, 256)],
+    dtype=np.uint8,
+)
+
+
+def build_level(columns: int = 400, seed: int = 726) -> tuple[np.ndarray, list[int]]:
+    """
+    Returns a (16, columns) tile map and the starting pixel positions of its enemies.
+    """
+    rng = np.random.default_rng(seed)
+    level = np.zeros((SCREEN_ROWS, columns), dtype=np.uint8)
+    level[14:16] = GROUND
+
+    enemies = []
+    col = 24
+    while col < columns - 8:
+        feature = rng.integers(0, 3)
+        if feature == 0:
+            level[14:16, col : col + 2] = 0
+        elif feature == 1:
+            height = int(rng.integers(2, 4))
+            level[14 - height : 14, col : col + 2] = PIPE
+        else:
+            enemies.append(col * 8)
+        col += int(rng.integers(10, 24))
+
+    return level, enemies
+
+
+class StubMemory:
+    """
+    A flat 64KiB address space indexed like PyBoy's memory view.
+    """
+
+    def __init__(self) -> None:
+        self.data = bytearray(0x10000)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return list(self.data[key])
+        return self.data[key]
+
+    def __setitem__(self, key, value) -> None:
+        self.data[key] = value
+
+
+class StubScreen:
+    def __init__(self) -> None:
+        self.ndarray = np.zeros((144, 160, 4), dtype=np.uint8)
+        # (SCX, SCY, WX, WY) per scanline
+        self.tilemap_position_list = [[7, 0, 0, 0] for _ in range(144)]
+
+
+class StubGameWrapper:
+    def __init__(self, emulator: "StubPyBoy") -> None:
+        self.emulator = emulator
+        self.mapping_compressed = np.arange(256, dtype=np.uint8)
+        self.score = 0
+
+    def game_area_mapping(self, mapping, sprite_offset) -> None:
+        # The stub's tiles are already the compressed classes
+        pass
+
+    def game_area(self) -> np.ndarray:
+        return self.emulator.game_area()
+
+    def post_tick(self) -> None:
+        # The stub writes the score and game area on every tick and load, nothing is cached
+        pass
+
+
+class StubPyBoy:
+    """
+    Implements the subset of the PyBoy interface used by PyboyEnvironment and MarioController.
+
+    Args:
+        rom_path (str): Ignored, accepted so the stub can replace PyBoy directly.
+        window (str): Ignored.
+        max_frames (int): Frames until the game is over. Defaults to 12000.
+    """
+
+    cartridge_title = "SUPER MARIOLAN"
+
+    def __init__(
+        self, rom_path: str = "", window: str = "null", max_frames: int = 12000
+    ) -> None:
+        self.max_frames = max_frames
+
+        self.level, enemy_positions = build_level()
+        self.memory = StubMemory()
+        self.screen = StubScreen()
+        self.game_wrapper = StubGameWrapper(self)
+
+        self.frame_count = 0
+        self._held: set[str] = set()
+        self._state = {
+            "x": 16,
+            "jump": 0,
+            "lives": 2,
+            "score": 0,
+            "elapsed": 0,
+            "game_over": False,
+            "enemies": list(enemy_positions),
+        }
+        self._write_memory()
+        self._initial = self._dump()
+
+    def initial_state(self) -> bytes:
+        """
+        The state the stub starts in, used in place of init.state.
+        """
+        return self._initial
+
+    def set_emulation_speed(self, speed: int) -> None:
+        pass
+
+    def send_input(self, event: int) -> None:
+        name = _EVENT_NAMES.get(int(event))
+        if name is None:
+            return
+        button = name.split("_", 1)[1]
+        if name.startswith("PRESS"):
+            self._held.add(button)
+        else:
+            self._held.discard(button)
+
+    def tick(self, count: int = 1, render: bool = True) -> bool:
+        for _ in range(count):
+            self.frame_count += 1
+            if not self._state["game_over"]:
+                self._step()
+        self._write_memory()
+        if render:
+            self._render()
+        return True
+
+    def save_state(self, file) -> None:
+        file.write(self._dump())
+
+    def load_state(self, file) -> None:
+        data = pickle.loads(file.read())
+        self._state = data["state"]
+        self._held = set(data["held"])
+        self._write_memory()
+
+    def stop(self, save: bool = True) -> None:
+        pass
+
+    def _dump(self) -> bytes:
+        state = dict(self._state, enemies=list(self._state["enemies"]))
+        return pickle.dumps({"state": state, "held": sorted(self._held)})
+
+    def _mario_pixels(self) -> tuple[int, int, int]:
+        # Returns (bottom row, x, camera x) of Mario
+        state = self._state
+        camera = min(max(0, state["x"] - 64), self.level.shape[1] * 8 - 160)
+        lift = 3 if 4 < state["jump"] < _JUMP_FRAMES - 2 else 0
+        return 13 - lift, state["x"], camera
+
+    @property
+    def camera_x(self) -> int:
+        """
+        The pixel column of the level at the left edge of the screen.
+        """
+        return self._mario_pixels()[2]
+
+    def _mario(self) -> tuple[int, int, int]:
+        # Returns (bottom row, screen column, camera column) of Mario
+        bottom, x, camera = self._mario_pixels()
+        return bottom, (x - camera) // 8, camera // 8
+
+    def _step(self) -> None:
+        state = self._state
+        level = self.level
+
+        if state["jump"] > 0:
+            state["jump"] -= 1
+        elif "BUTTON_A" in self._held:
+            state["jump"] = _JUMP_FRAMES
+
+        bottom, _, _ = self._mario()
+        step = ("ARROW_RIGHT" in self._held) - ("ARROW_LEFT" in self._held)
+        target = min(max(state["x"] + step, 0), level.shape[1] * 8 - 16)
+        front = (target + (15 if step > 0 else 0)) // 8
+        if not level[bottom, front]:
+            state["x"] = target
+
+        col = state["x"] // 8
+        grounded = state["jump"] == 0
+        if grounded and not level[14, col] and not level[14, col + 1]:
+            self._lose_life()
+
+        # Keyed on the saved clock rather than frame_count, which loading a state leaves alone,
+        # so a restored state always plays the same episode
+        if state["elapsed"] % 2 == 0:
+            state["enemies"] = [x - 1 for x in state["enemies"] if x > 0]
+
+        for enemy in list(state["enemies"]):
+            if abs(enemy - state["x"]) < 12:
+                if bottom < 13 or state["jump"]:
+                    state["enemies"].remove(enemy)
+                    state["score"] += 100
+                else:
+                    self._lose_life()
+                    break
+
+        state["elapsed"] += 1
+        if state["elapsed"] >= min(self.max_frames, 400 * 40):
+            state["game_over"] = True
+
+    def _lose_life(self) -> None:
+        state = self._state
+        state["lives"] -= 1
+        state["x"] = max(16, state["x"] - 96)
+        state["jump"] = 0
+        if state["lives"] < 0:
+            state["lives"] = 0
+            state["game_over"] = True
+
+    def _write_memory(self) -> None:
+        state = self._state
+        memory = self.memory.data
+
+        # Like the game, C202 is Mario's x on screen, SCX is the camera's pixel position and the
+        # level block steps as the fine scroll passes 8 (mod 16), which keeps get_x_position
+        # continuous at x + 9
+        bottom, _, camera = self._mario_pixels()
+        memory[0xC0AB] = ((camera + 8) // 16) & 0xFF
+        # C201 is Mario's y, C207 his jump progress
+        memory[0xC201] = bottom * 8
+        memory[0xC202] = state["x"] - camera
+        for position in self.screen.tilemap_position_list:
+            position[0] = camera % 256
+        memory[0xC203] = 1 if state["jump"] else 0
+        memory[0xC207] = state["jump"]
+        memory[0xDA15] = state["lives"]
+        memory[0x982C] = 1
+        memory[0x982E] = 1
+        time_left = max(0, 400 - state["elapsed"] // 40)
+        memory[0x9831] = time_left // 100
+        memory[0x9832] = time_left // 10 % 10
+        memory[0x9833] = time_left % 10
+        memory[0xC0A4] = 0x39 if state["game_over"] else 0
+        memory[0xFFA6] = 0
+        memory[0xC0AC] = 0
+        memory[0xFFFA] = 0
+
+        self.game_wrapper.score = state["score"]
+
+    def game_area(self) -> np.ndarray:
+        bottom, mario_col, camera_col = self._mario()
+
+        area = self.level[:, camera_col : camera_col + SCREEN_COLS].astype(np.uint32)
+        for enemy in self._state["enemies"]:
+            col = enemy // 8 - camera_col
+            if 0 <= col < SCREEN_COLS:
+                area[13, col] = ENEMY
+        area[bottom - 1 : bottom + 1, mario_col : mario_col + 2] = MARIO
+        return area
+
+    def _render(self) -> None:
+        tiles = _PALETTE[self.game_area()]
+        self.screen.ndarray[16:144] = tiles.repeat(8, axis=0).repeat(8, axis=1)
+
+
+@contextlib.contextmanager
+def stub_backend(max_frames: int = 12000):
+    """
+    Makes every environment created inside the block run on StubPyBoy instead of the ROM.
+    """
+    original = pyboy_environment.PyBoy
+    pyboy_environment.PyBoy = lambda rom_path, window="null": StubPyBoy(
+        rom_path, window, max_frames=max_frames
+    )
+    try:
+        yield
+    finally:
+        pyboy_environment.PyBoy = original
+
+
+def stub_controller(max_frames: int = 12000, **kwargs):
+    """
+    Builds a MarioController on StubPyBoy, for use as a picklable environment factory.
+    """
+    # Imported here as mario_expert is only needed by callers that want a controller
+    from mario_expert import (  # pylint: disable=import-outside-toplevel
+        MarioController,
+    )
+
+    with stub_backend(max_frames):
+        return MarioController(**kwargs)
@@ -0,0 +1,200 @@
+"""
+Sources that student submissions can be fetched from.
+
+A SubmissionSource lists each submission's files with a version token (a checksum, or size and
+mtime) and downloads them. sync_submissions fetches every submission concurrently into its own
+workspace and skips any file whose version matches the last sync, so re-grading after a single
+late submission only fetches that one.
+"""
+
+import json
+import logging
+import os
+import shutil
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple
+
+SUBMISSION_FILES = ("mario_expert.py", "requirements.txt")
+
+_MANIFEST = ".manifest.json"
+
+
+class RemoteFile(NamedTuple):
+    name: str
+    id: str
+    version: str
+
+
+class Submission(NamedTuple):
+    upi: str
+    workspace: str
+    changed: bool
+
+
+class SubmissionSource(metaclass=ABCMeta):
+    """
+    This is a base class for the places submissions are read from.
+    """
+
+    @abstractmethod
+    def list_submissions(self) -> dict[str, dict[str, RemoteFile]]:
+        """
+        Returns the files of every submission, keyed by upi and then file name.
+        """
+
+    @abstractmethod
+    def fetch(self, file: RemoteFile, path: str) -> None:
+        """
+        Downloads a file to path.
+        """
+
+
+class LocalSource(SubmissionSource):
+    """
+    Reads submissions from a local directory laid out as <root>/<upi>/<file>.
+
+    Args:
+        root (str): The directory holding one folder per submission.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def list_submissions(self) -> dict[str, dict[str, RemoteFile]]:
+        submissions = {}
+        for entry in sorted(os.scandir(self.root), key=lambda entry: entry.name):
+            if not entry.is_dir():
+                continue
+
+            files = {}
+            for file in os.scandir(entry.path):
+                if file.is_file():
+                    stat = file.stat()
+                    version = f"{stat.st_size}-{stat.st_mtime_ns}"
+                    files[file.name] = RemoteFile(file.name, file.path, version)
+            submissions[entry.name] = files
+        return submissions
+
+    def fetch(self, file: RemoteFile, path: str) -> None:
+        shutil.copy2(file.id, path)
+
+
+class DriveSource(SubmissionSource):
+    """
+    Reads submissions from a Google Drive folder with one sub-folder per submission.
+
+    PyDrive2 gives each thread its own authorised connection, which is reused for every request
+    that thread makes.
+
+    Args:
+        drive (GoogleDrive): An authorised PyDrive2 client.
+        folder_id (str): The Drive id of the folder holding the submissions.
+        workers (int): The number of concurrent listing requests. Defaults to 8.
+    """
+
+    FOLDER = "application/vnd.google-apps.folder"
+
+    def __init__(self, drive, folder_id: str, workers: int = 8) -> None:
+        self.drive = drive
+        self.folder_id = folder_id
+        self.workers = workers
+
+    def _list(self, folder_id: str) -> list:
+        return self.drive.ListFile(
+            {"q": f"'{folder_id}' in parents and trashed=false"}
+        ).GetList()
+
+    def list_submissions(self) -> dict[str, dict[str, RemoteFile]]:
+        folders = [
+            f for f in self._list(self.folder_id) if f["mimeType"] == self.FOLDER
+        ]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            listings = pool.map(lambda folder: self._list(folder["id"]), folders)
+
+            submissions = {}
+            for folder, listing in zip(folders, listings):
+                submissions[folder["title"]] = {
+                    f["title"]: RemoteFile(
+                        f["title"],
+                        f["id"],
+                        f.get("md5Checksum") or f.get("modifiedDate", ""),
+                    )
+                    for f in listing
+                    if f["mimeType"] != self.FOLDER
+                }
+        return submissions
+
+    def fetch(self, file: RemoteFile, path: str) -> None:
+        self.drive.CreateFile({"id": file.id}).GetContentFile(path)
+
+
+def _sync_one(
+    source: SubmissionSource,
+    upi: str,
+    files: dict[str, RemoteFile],
+    workspace: str,
+    on_synced: Callable[[Submission], None] | None,
+) -> Submission:
+    os.makedirs(workspace, exist_ok=True)
+
+    manifest_path = f"{workspace}/{_MANIFEST}"
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+
+    changed = False
+    for name in SUBMISSION_FILES:
+        remote = files[name]
+        path = f"{workspace}/{name}"
+        if manifest.get(name) == remote.version and os.path.exists(path):
+            continue
+
+        # Download next to the target and rename so a crash never leaves half a file behind
+        source.fetch(remote, f"{path}.part")
+        os.replace(f"{path}.part", path)
+        manifest[name] = remote.version
+        changed = True
+
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+
+    submission = Submission(upi, workspace, changed)
+    if on_synced is not None:
+        on_synced(submission)
+    return submission
+
+
+def sync_submissions(
+    source: SubmissionSource,
+    workspaces_path: str,
+    workers: int = 8,
+    on_synced: Callable[[Submission], None] | None = None,
+) -> list[Submission]:
+    """
+    Fetches every complete submission into <workspaces_path>/<upi>, skipping unchanged files.
+
+    on_synced is called from the fetching thread as soon as each submission is on disk, so later
+    stages can start before the slowest download finishes.
+    """
+    submissions = source.list_submissions()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for upi, files in submissions.items():
+            missing = [name for name in SUBMISSION_FILES if name not in files]
+            if missing:
+                logging.warning(f"Skipping {upi} - missing {', '.join(missing)}")
+                continue
+            futures[upi] = pool.submit(
+                _sync_one, source, upi, files, f"{workspaces_path}/{upi}", on_synced
+            )
+
+        synced = []
+        for upi, future in futures.items():
+            submission = future.result()
+            logging.info(f"{upi}: {'fetched' if submission.changed else 'unchanged'}")
+            synced.append(submission)
+    return synced
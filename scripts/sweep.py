@@ -0,0 +1,281 @@
+"""
+Parallel parameter sweep of the Mario Expert with successive halving.
+
+Every configuration in the sweep - a sample of the grid of ExpertParams values - is played for a
+short tick budget on a pool of warm headless workers and ranked by its progress through the
+game. Only the best 1 / eta go on to the next round, which has eta times the budget, and they
+resume from the savestate their last round ended on instead of starting over, so the sweep
+costs a few full-length runs however many configurations it starts with. A ranked report is
+written to sweep.json.
+
+python3 sweep.py --name my_sweep --configs 81 --min_ticks 600 --max_ticks 48600 --workers 32
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import time
+from pathlib import Path
+
+from episode_watchdog import progress
+
+logging.basicConfig(level=logging.INFO)
+
+# The values tried for each ExpertParams field, the defaults are included in each
+SPACE = {
+    "act_freq": [6, 8, 10, 12, 15],
+    "enemy_distance": [2, 3, 4, 5],
+    "jump_near": [1, 2],
+    "jump_far": [3, 4],
+    "ground_lookahead": [3, 4, 5],
+    "bunbun_lookahead": [1, 2, 3],
+}
+
+# The warm expert owned by each worker process
+_expert = None
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("--name", type=str, required=True)
+    parse_args.add_argument("--workers", type=int, default=os.cpu_count())
+    parse_args.add_argument(
+        "--configs",
+        type=int,
+        default=81,
+        help="Configurations sampled from the grid, 0 runs the whole grid",
+    )
+    parse_args.add_argument(
+        "--param",
+        type=str,
+        nargs="*",
+        default=[],
+        help="NAME=V1,V2,... replacing the values tried for a parameter",
+    )
+    parse_args.add_argument("--min_ticks", type=int, default=600)
+    parse_args.add_argument("--max_ticks", type=int, default=48600)
+    parse_args.add_argument("--eta", type=int, default=3)
+    parse_args.add_argument("--seed", type=int, default=0)
+    parse_args.add_argument("--backend", choices=["rom", "stub"], default="rom")
+
+    return parse_args.parse_args()
+
+
+def _init_worker(backend: str) -> None:
+    # Imported here so the parent process never loads the emulator
+    # pylint: disable=import-outside-toplevel
+    from mario_expert import MarioExpert
+    from stub_emulator import stub_backend
+
+    global _expert  # pylint: disable=global-statement
+    if backend == "stub":
+        with stub_backend():
+            _expert = MarioExpert(results_path="", headless=True)
+    else:
+        _expert = MarioExpert(results_path="", headless=True)
+    _expert.environment.pyboy.set_emulation_speed(0)
+    _expert.enable_no_capture()
+
+
+def run_trial(trial: dict) -> dict:
+    """
+    Plays one configuration from its last savestate, or from the start, until it has been played
+    for trial["ticks"] ticks in total or the game is over.
+    """
+    # Imported here so the parent process never loads the emulator
+    from mario_expert import ExpertParams  # pylint: disable=import-outside-toplevel
+
+    expert = _expert
+    environment = expert.environment
+    expert.set_params(ExpertParams(**trial["params"]))
+
+    if trial["state"] is None:
+        environment.reset()
+    else:
+        environment.restore_state(trial["state"])
+
+    start = time.perf_counter()
+    start_tick = environment.ticks
+    remaining = trial["ticks"] - trial["played"]
+    while environment.ticks - start_tick < remaining:
+        if environment.get_game_over():
+            break
+        expert.step()
+    played = environment.ticks - start_tick
+
+    return {
+        "config": trial["config"],
+        "state": environment.capture_state(),
+        "results": environment.game_state(),
+        "played": trial["played"] + played,
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+def grid(space: dict, configs: int, seed: int) -> list[dict]:
+    names = list(space)
+    combinations = [
+        dict(zip(names, values))
+        for values in itertools.product(*(space[name] for name in names))
+    ]
+    if configs and configs < len(combinations):
+        combinations = random.Random(seed).sample(combinations, configs)
+    return combinations
+
+
+def budgets(min_ticks: int, max_ticks: int, eta: int, configs: int) -> list[int]:
+    """
+    The total ticks played by the end of each round, the last being max_ticks.
+    """
+    rounds = max(1, math.ceil(math.log(max(configs, 1), eta)) + 1)
+    ticks = [min(min_ticks * eta**i, max_ticks) for i in range(rounds)]
+    ticks[-1] = max_ticks
+    return sorted(set(ticks))
+
+
+def rank(entries: list[dict]) -> list[dict]:
+    return sorted(
+        entries,
+        key=lambda entry: (
+            progress(entry["results"]),
+            entry["results"]["lives"],
+            entry["results"]["score"],
+        ),
+        reverse=True,
+    )
+
+
+def sweep(name, space, configs, workers, min_ticks, max_ticks, eta, seed, backend):
+    sweep_path = f"{Path(__file__).parent.parent}/results/{name}"
+    os.makedirs(sweep_path, exist_ok=True)
+    logging.info(f"Saving data into: {sweep_path}")
+
+    entries = [
+        {
+            "config": i,
+            "params": params,
+            "state": None,
+            "results": None,
+            "played": 0,
+            "elapsed": 0.0,
+            "rounds": [],
+        }
+        for i, params in enumerate(grid(space, configs, seed))
+    ]
+    schedule = budgets(min_ticks, max_ticks, eta, len(entries))
+    logging.info(
+        f"Sweeping {len(entries)} configurations over {len(schedule)} rounds of "
+        f"{', '.join(str(ticks) for ticks in schedule)} ticks"
+    )
+
+    survivors = entries
+    start = time.perf_counter()
+    processes = max(1, min(workers, len(entries)))
+    with multiprocessing.Pool(
+        processes=processes, initializer=_init_worker, initargs=(backend,)
+    ) as pool:
+        for round_number, ticks in enumerate(schedule):
+            trials = [
+                {
+                    "config": entry["config"],
+                    "params": entry["params"],
+                    "state": entry["state"],
+                    "played": entry["played"],
+                    "ticks": ticks,
+                }
+                for entry in survivors
+            ]
+            for result in pool.imap_unordered(run_trial, trials):
+                entry = entries[result["config"]]
+                entry["state"] = result["state"]
+                entry["results"] = result["results"]
+                entry["played"] = result["played"]
+                entry["elapsed"] += result["elapsed"]
+                entry["rounds"].append(progress(result["results"]))
+
+            survivors = rank(survivors)
+            best = survivors[0]
+            logging.info(
+                f"Round {round_number} at {ticks} ticks - best config {best['config']} "
+                f"progress {progress(best['results'])} {best['params']}"
+            )
+            if round_number < len(schedule) - 1:
+                kept = max(1, math.ceil(len(survivors) / eta))
+                for entry in survivors[kept:]:
+                    # Pruned configurations are never resumed
+                    entry["state"] = None
+                survivors = survivors[:kept]
+    wall_time = time.perf_counter() - start
+
+    # Configurations that lasted more rounds rank above every one pruned before them
+    ranked = sorted(rank(entries), key=lambda entry: len(entry["rounds"]), reverse=True)
+    report = {
+        "space": space,
+        "schedule": schedule,
+        "eta": eta,
+        "wall_time": wall_time,
+        "ticks_played": sum(entry["played"] for entry in entries),
+        "ranking": [
+            {
+                "rank": i + 1,
+                "config": entry["config"],
+                "params": entry["params"],
+                "rounds": len(entry["rounds"]),
+                "progress": entry["rounds"],
+                "ticks": entry["played"],
+                "elapsed": entry["elapsed"],
+                "results": entry["results"],
+            }
+            for i, entry in enumerate(ranked)
+        ],
+    }
+    with open(f"{sweep_path}/sweep.json", "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+    full = len(entries) * max_ticks
+    logging.info(
+        f"Played {report['ticks_played']} ticks in {wall_time:.1f}s, "
+        f"{report['ticks_played'] / full:.1%} of evaluating every configuration in full"
+    )
+    for entry in report["ranking"][:10]:
+        logging.info(
+            f"#{entry['rank']} config {entry['config']} after {entry['rounds']} rounds "
+            f"progress {entry['progress'][-1]} {entry['params']}"
+        )
+
+    return report
+
+
+def main():
+    args = get_args()
+
+    space = dict(SPACE)
+    for item in args.param:
+        name, values = item.split("=", 1)
+        if name not in SPACE:
+            raise SystemExit(
+                f"Unknown parameter {name}, choose from {', '.join(SPACE)}"
+            )
+        space[name] = [int(value) for value in values.split(",")]
+
+    sweep(
+        args.name,
+        space,
+        args.configs,
+        args.workers,
+        args.min_ticks,
+        args.max_ticks,
+        args.eta,
+        args.seed,
+        args.backend,
+    )
+
+
+if __name__ == "__main__":
+    main()
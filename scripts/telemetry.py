@@ -0,0 +1,214 @@
+"""
+Opt-in per-step telemetry for the Mario Expert agent.
+
+Telemetry keeps log2 latency histograms for each stage of a step (decision, emulation, capture and
+encode) together with action counts, x_position progress and stage transitions. Every counter is
+preallocated, recording a sample is a handful of list index operations, and the hot paths only
+check whether telemetry is attached at all - so an agent without it pays a single attribute test.
+
+SamplingProfiler periodically captures the stack of the thread making decisions and writes the
+samples in the collapsed format read by flamegraph.pl and speedscope.
+
+MARIO_TELEMETRY=1 python3 run.py --headless
+MARIO_TELEMETRY=1 MARIO_PROFILE=1 python3 run.py --headless
+"""
+
+import json
+import sys
+import threading
+import time
+
+DECISION = 0
+EMULATION = 1
+CAPTURE = 2
+ENCODE = 3
+
+STAGE_NAMES = ("decision", "emulation", "capture", "encode")
+
+# Bucket b counts samples of [2^(b-1), 2^b) nanoseconds, the last bucket is open ended (~9 min)
+BUCKETS = 40
+
+
+class Telemetry:
+    """
+    Latency histograms and progress counters for a single episode.
+
+    Args:
+        num_actions (int): The number of distinct actions the agent can take. Defaults to 7.
+    """
+
+    def __init__(self, num_actions: int = 7) -> None:
+        stages = len(STAGE_NAMES)
+        self.histograms = [[0] * BUCKETS for _ in range(stages)]
+        self.totals = [0] * stages
+        self.counts = [0] * stages
+        self.maxima = [0] * stages
+
+        self.actions = [0] * num_actions
+        self.steps = 0
+
+        self.start_time = time.perf_counter()
+        self.start_frame = None
+        self.last_frame = 0
+        self.start_x = 0
+        self.last_x = 0
+        self.max_x = 0
+
+        self._stage = None
+        self.transitions: list[dict] = []
+
+    def record(self, stage: int, nanoseconds: int) -> None:
+        """
+        Adds a latency sample to a stage's histogram.
+        """
+        bucket = nanoseconds.bit_length()
+        self.histograms[stage][bucket if bucket < BUCKETS else BUCKETS - 1] += 1
+        self.totals[stage] += nanoseconds
+        self.counts[stage] += 1
+        if nanoseconds > self.maxima[stage]:
+            self.maxima[stage] = nanoseconds
+
+    def record_step(
+        self, action: int, frame: int, x_position: int, world: int, stage: int
+    ) -> None:
+        """
+        Counts the action taken and tracks progress and stage changes after it ran.
+        """
+        self.actions[action] += 1
+        self.steps += 1
+
+        if self.start_frame is None:
+            self.start_frame = frame
+            self.start_x = x_position
+        self.last_frame = frame
+        self.last_x = x_position
+        if x_position > self.max_x:
+            self.max_x = x_position
+
+        current = (world, stage)
+        if current != self._stage:
+            if self._stage is not None:
+                self.transitions.append(
+                    {
+                        "frame": frame,
+                        "step": self.steps,
+                        "from": list(self._stage),
+                        "to": list(current),
+                    }
+                )
+            self._stage = current
+
+    def _percentile(self, stage: int, fraction: float) -> int:
+        # Upper bound of the bucket holding the requested sample, in nanoseconds
+        target = fraction * self.counts[stage]
+        seen = 0
+        for bucket, count in enumerate(self.histograms[stage]):
+            seen += count
+            if count and seen >= target:
+                return 1 << bucket
+        return 0
+
+    def summary(self) -> dict:
+        """
+        Returns the metrics as a JSON serialisable dictionary, latencies are in microseconds.
+        """
+        latency = {}
+        for index, name in enumerate(STAGE_NAMES):
+            count = self.counts[index]
+            latency[name] = {
+                "count": count,
+                "mean": self.totals[index] / count / 1000 if count else 0.0,
+                "p50": self._percentile(index, 0.5) / 1000,
+                "p90": self._percentile(index, 0.9) / 1000,
+                "p99": self._percentile(index, 0.99) / 1000,
+                "max": self.maxima[index] / 1000,
+                "histogram": self.histograms[index],
+            }
+
+        frames = self.last_frame - (self.start_frame or 0)
+        elapsed = time.perf_counter() - self.start_time
+        return {
+            "steps": self.steps,
+            "frames": frames,
+            "seconds": elapsed,
+            "steps_per_second": self.steps / elapsed if elapsed else 0.0,
+            "latency_us": latency,
+            "histogram_bucket_upper_bounds_ns": [1 << b for b in range(BUCKETS)],
+            "actions": self.actions,
+            "progress": {
+                "start_x": self.start_x,
+                "final_x": self.last_x,
+                "max_x": self.max_x,
+                "x_per_step": (
+                    (self.last_x - self.start_x) / self.steps if self.steps else 0.0
+                ),
+                "x_per_frame": (self.last_x - self.start_x) / frames if frames else 0.0,
+            },
+            "stage_transitions": self.transitions,
+        }
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread while it is marked active and counts each distinct stack.
+
+    The sampled thread sets active around the code of interest, so only time spent there is
+    attributed. Stacks are written root first, one "frame;frame;frame count" line per stack.
+
+    Args:
+        interval (float): Seconds between samples. Defaults to 0.001.
+        thread_id (int): The thread to sample. Defaults to the calling thread.
+    """
+
+    def __init__(self, interval: float = 0.001, thread_id: int | None = None) -> None:
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.active = False
+        self.samples: dict[str, int] = {}
+
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._sample, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in sorted(self.samples.items()):
+                file.write(f"{stack} {count}\n")
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            if not self.active:
+                continue
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            frame = frames.get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.samples[key] = self.samples.get(key, 0) + 1
@@ -0,0 +1,37 @@
+"""
+Checks that evaluation episodes are reproducible per seed and vary between seeds, on the stub
+emulator so the ROM is not needed.
+
+python -m pytest test_evaluate.py
+"""
+
+import pytest
+
+import evaluate
+from stub_emulator import stub_backend
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _worker():
+    with stub_backend():
+        evaluate._init_worker()  # pylint: disable=protected-access
+
+
+def _run(path, seed: int) -> dict:
+    episode = {
+        "episode": 0,
+        "seed": seed,
+        "noop_frames": evaluate.noop_frames(seed, 30),
+        "checkpoint": None,
+        "results_path": f"{path}/seed_{seed}",
+    }
+    return evaluate.run_episode(episode)["results"]
+
+
+def test_same_seed_same_result(tmp_path):
+    assert _run(tmp_path / "first", 2) == _run(tmp_path / "second", 2)
+
+
+def test_seeds_vary_results(tmp_path):
+    results = [_run(tmp_path, seed) for seed in range(4)]
+    assert len({tuple(sorted(result.items())) for result in results}) > 1
@@ -0,0 +1,56 @@
+"""
+Checks that camera_column follows the game area's tile alignment and that the LevelMap stitched
+from it matches the level, run on the stub emulator so the ROM is not needed.
+
+python -m pytest test_level_map.py
+"""
+
+import numpy as np
+
+from level_map import GAP, LevelMap
+from mario_expert import RIGHT
+from stub_emulator import stub_controller
+
+
+def _scroll(controller, frames: int):
+    """
+    Holds right and yields the observation after every frame.
+    """
+    controller.press(RIGHT)
+    for _ in range(frames):
+        controller.advance(1)
+        yield controller.observe()
+    controller.release(RIGHT)
+
+
+def test_camera_column_at_unaligned_scroll():
+    controller = stub_controller()
+    controller.reset()
+
+    unaligned = 0
+    for observation in _scroll(controller, 400):
+        camera = controller.pyboy.camera_x
+        assert observation.camera_column == camera // 8
+        assert observation.camera_column % 32 == observation.scroll_x // 8
+        unaligned += observation.scroll_x % 8 != 0
+
+    assert unaligned > 0
+
+
+def test_stitched_map_matches_level():
+    controller = stub_controller()
+    controller.reset()
+
+    level_map = LevelMap()
+    for observation in _scroll(controller, 400):
+        level_map.update(observation.game_area, observation.camera_column)
+
+    level = controller.pyboy.level
+    assert level_map.width > 20
+    np.testing.assert_array_equal(
+        level_map.window(0, level_map.width)[14:], level[14:, : level_map.width]
+    )
+
+    gaps = [c for c in range(level_map.width) if not level[15, c]]
+    assert level_map.columns(GAP) == gaps
+    assert level_map.next(GAP, 0) == gaps[0]
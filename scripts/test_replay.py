@@ -0,0 +1,44 @@
+"""
+Checks that replaying an action log ends in exactly the state the recorded episode did, on the
+stub emulator so the ROM is not needed.
+
+python -m pytest test_replay.py
+"""
+
+import io
+
+import replay
+from mario_expert import MarioExpert
+from stub_emulator import stub_backend
+
+
+def _state(pyboy) -> bytes:
+    buffer = io.BytesIO()
+    pyboy.save_state(buffer)
+    return buffer.getvalue()
+
+
+def test_replay_matches_recording(tmp_path):
+    with stub_backend():
+        expert = MarioExpert(str(tmp_path), headless=True)
+    expert.enable_action_log(video=False)
+    expert.play()
+    recorded = _state(expert.environment.pyboy)
+
+    replay._init_worker("stub", [])  # pylint: disable=protected-access
+    result = replay.replay(
+        {
+            "log": f"{tmp_path}/actions.json",
+            "output": f"{tmp_path}/replay",
+            "width": 160,
+            "height": 144,
+            "fps": 30,
+            "every_frame": False,
+        }
+    )
+
+    assert "error" not in result
+    assert result["matches"]
+    # The results only sample the state, the whole emulator state must match
+    controller = replay._controller  # pylint: disable=protected-access
+    assert _state(controller.pyboy) == recorded
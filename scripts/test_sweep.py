@@ -0,0 +1,38 @@
+"""
+Checks that a sweep trial's progress depends only on its configuration and savestate, not on
+what the worker played before, on the stub emulator so the ROM is not needed.
+
+python -m pytest test_sweep.py
+"""
+
+import pytest
+
+import sweep
+from episode_watchdog import progress
+from mario_expert import ExpertParams
+
+DEFAULTS = ExpertParams()._asdict()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _worker():
+    sweep._init_worker("stub")  # pylint: disable=protected-access
+
+
+def _play(params: dict, rounds: list[int]) -> tuple:
+    # Plays a config to each total in rounds, resuming from the state each round ended on
+    trial = {"config": 0, "params": params, "state": None, "played": 0}
+    for ticks in rounds:
+        result = sweep.run_trial({**trial, "ticks": ticks})
+        trial.update(state=result["state"], played=result["played"])
+    return progress(result["results"]), result["results"], result["played"]
+
+
+def test_same_config_same_progress():
+    pyboy = sweep._expert.environment.pyboy  # pylint: disable=protected-access
+    parity = pyboy.frame_count % 2
+    first = _play(DEFAULTS, [200, 600, 1800])
+    # Loading a state leaves the frame count alone, start the second run at the other parity
+    if pyboy.frame_count % 2 == parity:
+        pyboy.tick(1, False)
+    assert _play(DEFAULTS, [200, 600, 1800]) == first
@@ -0,0 +1,272 @@
+"""
+Per-step trajectories of an episode in a chunked, compressed columnar file.
+
+TrajectoryWriter appends each step's tick, action, game state fields and game area into
+preallocated column arrays. When a chunk fills up it is handed to a background thread that
+compresses every column separately (zlib releases the GIL) and appends it to the file, so a step
+costs a handful of array stores. Every chunk starts with a small header describing its columns,
+which keeps a file readable up to its last complete chunk even if the episode was killed.
+
+TrajectoryReader memory-maps a file and decompresses only the chunks and columns asked for, so
+one column or a range of steps is read without touching the rest, and iter_chunks walks any
+number of episodes in bounded memory.
+
+with TrajectoryReader(f"{results_path}/trajectory.trj") as trajectory:
+    x_positions = trajectory.column("x_position")
+    game_areas = trajectory.column("game_area", start=1000, stop=2000)
+"""
+
+import json
+import mmap
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+COLUMNS = {
+    "tick": (np.int64, ()),
+    "action": (np.int8, ()),
+    "world": (np.uint8, ()),
+    "stage": (np.uint8, ()),
+    "x_position": (np.int32, ()),
+    "lives": (np.int16, ()),
+    "score": (np.int32, ()),
+    "coins": (np.int16, ()),
+    "time": (np.int16, ()),
+    "dead_timer": (np.uint8, ()),
+    "dead_jump_timer": (np.uint8, ()),
+    "game_area": (np.uint8, (16, 20)),
+}
+
+# The game state fields copied into the column of the same name
+_STATE_COLUMNS = [
+    name for name in COLUMNS if name not in ("tick", "action", "game_area")
+]
+# Every scalar column is filled as one row, a single store per step
+_ROW_DTYPE = np.dtype(
+    [(name, dtype) for name, (dtype, shape) in COLUMNS.items() if shape == ()]
+)
+
+# Magic and header length in front of every chunk
+_CHUNK = struct.Struct("<4sI")
+_MAGIC = b"TRJ1"
+
+
+class TrajectoryWriter:
+    """
+    Records the steps of one episode to a trajectory file.
+
+    Args:
+        path (str): The file to write, replaced if it exists.
+        chunk_steps (int): The number of steps compressed together. Defaults to 1024.
+        level (int): The zlib compression level. Defaults to 1, the fastest.
+    """
+
+    def __init__(self, path: str, chunk_steps: int = 1024, level: int = 1) -> None:
+        self.path = path
+        self.chunk_steps = chunk_steps
+        self.level = level
+        self.steps = 0
+
+        self._file = open(path, "wb")  # pylint: disable=consider-using-with
+        self._columns = self._allocate()
+        self._count = 0
+
+        # Two sets of columns alternate between being filled and being compressed
+        self._spare: queue.Queue = queue.Queue()
+        self._spare.put(self._allocate())
+        self._pending: queue.Queue = queue.Queue()
+        self._error: BaseException | None = None
+        self._closed = False
+
+        self._worker = threading.Thread(
+            target=self._compress, name="trajectory-writer", daemon=True
+        )
+        self._worker.start()
+
+    def _allocate(self) -> tuple[np.ndarray, np.ndarray]:
+        return (
+            np.zeros(self.chunk_steps, dtype=_ROW_DTYPE),
+            np.zeros((self.chunk_steps, *COLUMNS["game_area"][1]), dtype=np.uint8),
+        )
+
+    def append(
+        self, tick: int, action: int, state: dict, game_area: np.ndarray
+    ) -> None:
+        i = self._count
+        rows, game_areas = self._columns
+        rows[i] = (tick, action, *[state[name] for name in _STATE_COLUMNS])
+        game_areas[i] = game_area
+
+        self._count = i + 1
+        self.steps += 1
+        if self._count == self.chunk_steps:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Writing the trajectory failed") from error
+        if self._count == 0:
+            return
+
+        self._pending.put((self._columns, self.steps - self._count, self._count))
+        self._columns = self._spare.get()
+        self._count = 0
+
+    def _compress(self) -> None:
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+
+            columns, start, count = item
+            try:
+                if self._error is None:
+                    self._write_chunk(columns, start, count)
+            except Exception as error:  # pylint: disable=broad-except
+                # Keep recycling buffers so the producer never deadlocks
+                self._error = error
+            finally:
+                self._spare.put(columns)
+
+    def _write_chunk(self, columns: tuple, start: int, count: int) -> None:
+        rows, game_areas = columns
+        blobs = []
+        for name in COLUMNS:
+            values = game_areas if name == "game_area" else rows[name]
+            # Stored column by column, which compresses far better than rows
+            data = np.ascontiguousarray(values[:count])
+            blobs.append(zlib.compress(memoryview(data).cast("B"), self.level))
+        header = json.dumps(
+            {
+                "start": start,
+                "count": count,
+                "columns": {
+                    name: [np.dtype(dtype).str, list(shape), len(blob)]
+                    for (name, (dtype, shape)), blob in zip(COLUMNS.items(), blobs)
+                },
+            }
+        ).encode()
+
+        self._file.write(_CHUNK.pack(_MAGIC, len(header)))
+        self._file.write(header)
+        for blob in blobs:
+            self._file.write(blob)
+        # Complete chunks reach the file even if the episode is killed later
+        self._file.flush()
+
+    def close(self) -> None:
+        """
+        Writes the last partial chunk, waits for every chunk to be written and closes the file.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        try:
+            self._flush()
+        finally:
+            self._pending.put(None)
+            self._worker.join()
+            self._file.close()
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Writing the trajectory failed") from error
+
+
+class _Chunk:
+    def __init__(self, start: int, count: int, columns: dict, offset: int) -> None:
+        self.start = start
+        self.count = count
+        # name -> (dtype, shape, offset, length) of the compressed column
+        self.columns = {}
+        for name, (dtype, shape, length) in columns.items():
+            self.columns[name] = (np.dtype(dtype), tuple(shape), offset, length)
+            offset += length
+        self.end = offset
+
+
+class TrajectoryReader:
+    """
+    Reads columns of a trajectory file, decompressing only the chunks needed.
+
+    Args:
+        path (str): The file written by a TrajectoryWriter.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")  # pylint: disable=consider-using-with
+        self.chunks: list[_Chunk] = []
+
+        size = self._file.seek(0, 2)
+        self._map = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        )
+
+        offset = 0
+        while offset + _CHUNK.size <= size:
+            magic, length = _CHUNK.unpack_from(self._map, offset)
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is corrupt at byte {offset}")
+            body = offset + _CHUNK.size + length
+            if body > size:
+                break
+            header = json.loads(self._map[offset + _CHUNK.size : body])
+            chunk = _Chunk(header["start"], header["count"], header["columns"], body)
+            if chunk.end > size:
+                # The episode was killed while this chunk was being written
+                break
+            self.chunks.append(chunk)
+            offset = chunk.end
+
+        self.columns = list(self.chunks[0].columns) if self.chunks else list(COLUMNS)
+
+    def __len__(self) -> int:
+        return self.chunks[-1].start + self.chunks[-1].count if self.chunks else 0
+
+    def _decode(self, chunk: _Chunk, name: str) -> np.ndarray:
+        dtype, shape, offset, length = chunk.columns[name]
+        data = zlib.decompress(memoryview(self._map)[offset : offset + length])
+        return np.frombuffer(data, dtype=dtype).reshape(chunk.count, *shape)
+
+    def column(self, name: str, start: int = 0, stop: int | None = None) -> np.ndarray:
+        """
+        Returns steps start to stop of one column.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        parts = []
+        for chunk in self.chunks:
+            if chunk.start + chunk.count <= start or chunk.start >= stop:
+                continue
+            values = self._decode(chunk, name)
+            parts.append(values[max(start - chunk.start, 0) : stop - chunk.start])
+
+        if not parts:
+            dtype, shape = COLUMNS[name]
+            return np.zeros((0, *shape), dtype=dtype)
+        return np.concatenate(parts)
+
+    def iter_chunks(self, names: list[str] | None = None):
+        """
+        Yields each chunk as a dict of the named columns, all of them by default.
+        """
+        names = self.columns if names is None else names
+        for chunk in self.chunks:
+            yield {name: self._decode(chunk, name) for name in names}
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self) -> "TrajectoryReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,293 @@
+"""
+Many Mario environments stepped in lockstep behind one batched API.
+
+VecMarioEnvironment owns N MarioControllers sharded across worker processes. A step writes the
+vector of actions into shared memory, sends each worker a one word command, and every worker
+advances its emulators act_freq ticks and writes their game areas and game state fields straight
+into shared (N, 16, 20) and structured (N,) arrays - nothing per instance is pickled. Episodes
+that end are reset from the in-memory initial state within the same step.
+
+with VecMarioEnvironment(16, workers=4) as environment:
+    game_areas, states = environment.reset()
+    for _ in range(1000):
+        actions = np.random.randint(0, 7, size=environment.num_envs)
+        game_areas, states, dones, final_states = environment.step(actions)
+"""
+
+import functools
+import multiprocessing
+import os
+from multiprocessing.connection import Connection
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+STATE_DTYPE = np.dtype(
+    [
+        ("lives", np.int32),
+        ("score", np.int32),
+        ("coins", np.int32),
+        ("stage", np.int32),
+        ("world", np.int32),
+        ("x_position", np.int32),
+        ("time", np.int32),
+        ("dead_timer", np.int32),
+        ("dead_jump_timer", np.int32),
+        ("game_over", np.bool_),
+    ]
+)
+
+GAME_AREA_SHAPE = (16, 20)
+
+
+class VecObservation(NamedTuple):
+    game_areas: np.ndarray
+    states: np.ndarray
+
+
+class VecStep(NamedTuple):
+    game_areas: np.ndarray
+    states: np.ndarray
+    dones: np.ndarray
+    # The last state of every episode that ended this step, the others are left zeroed
+    final_states: np.ndarray
+
+
+class _Buffers:
+    # Views of the shared arrays every shard reads actions from and writes observations to
+    def __init__(self, num_envs: int, raw: dict) -> None:
+        self.raw = raw
+        self.actions = np.frombuffer(raw["actions"], dtype=np.int8)
+        self.game_areas = np.frombuffer(raw["game_areas"], dtype=np.uint8).reshape(
+            num_envs, *GAME_AREA_SHAPE
+        )
+        self.states = np.frombuffer(raw["states"], dtype=STATE_DTYPE)
+        self.final_states = np.frombuffer(raw["final_states"], dtype=STATE_DTYPE)
+        self.dones = np.frombuffer(raw["dones"], dtype=np.bool_)
+
+    @classmethod
+    def allocate(cls, num_envs: int) -> "_Buffers":
+        raw = {
+            "actions": multiprocessing.RawArray("b", num_envs),
+            "game_areas": multiprocessing.RawArray(
+                "B", num_envs * GAME_AREA_SHAPE[0] * GAME_AREA_SHAPE[1]
+            ),
+            "states": multiprocessing.RawArray("B", num_envs * STATE_DTYPE.itemsize),
+            "final_states": multiprocessing.RawArray(
+                "B", num_envs * STATE_DTYPE.itemsize
+            ),
+            "dones": multiprocessing.RawArray("B", num_envs),
+        }
+        return cls(num_envs, raw)
+
+
+class _Shard:
+    """
+    The controllers for a contiguous slice of the environments, run inside one process.
+    """
+
+    def __init__(
+        self,
+        indices: range,
+        buffers: _Buffers,
+        environment_factory: Callable,
+        initial_state: bytes | None,
+    ) -> None:
+        self.indices = indices
+        self.buffers = buffers
+        self.controllers = [environment_factory() for _ in indices]
+        for controller in self.controllers:
+            controller.pyboy.set_emulation_speed(0)
+            # Nothing reads the screen, only game_area and the RAM
+            controller.render_frames = False
+            if initial_state is not None:
+                controller.savestates.set_initial(initial_state)
+
+    def _write(self, index: int, controller, target: np.ndarray) -> None:
+        observation = controller.observe()
+        self.buffers.game_areas[index] = observation.game_area
+        state = observation.state
+        target[index] = tuple(state[name] for name in STATE_DTYPE.names)
+
+    def reset(self) -> None:
+        for index, controller in zip(self.indices, self.controllers):
+            controller.reset()
+            self._write(index, controller, self.buffers.states)
+        self.buffers.dones[self.indices.start : self.indices.stop] = False
+
+    def step(self) -> None:
+        buffers = self.buffers
+        actions = buffers.actions.tolist()
+        for index, controller in zip(self.indices, self.controllers):
+            controller.run_action(actions[index])
+
+            done = controller.observe().fields["game_over"]
+            buffers.dones[index] = done
+            if done:
+                self._write(index, controller, buffers.final_states)
+                controller.reset()
+            self._write(index, controller, buffers.states)
+
+    def close(self) -> None:
+        for controller in self.controllers:
+            controller.pyboy.stop(save=False)
+
+
+def _run_shard(
+    connection: Connection,
+    indices: range,
+    num_envs: int,
+    raw: dict,
+    environment_factory: Callable,
+    initial_state: bytes | None,
+) -> None:
+    shard = _Shard(indices, _Buffers(num_envs, raw), environment_factory, initial_state)
+    connection.send("ready")
+    try:
+        while True:
+            command = connection.recv()
+            if command == "close":
+                break
+            getattr(shard, command)()
+            connection.send(command)
+    finally:
+        shard.close()
+        connection.close()
+
+
+class VecMarioEnvironment:
+    """
+    Steps num_envs Mario environments together and returns stacked observations.
+
+    Args:
+        num_envs (int): The number of emulators.
+        workers (int): The number of processes the emulators are sharded across, 0 runs them
+            all in this process. Defaults to one per CPU, at most num_envs.
+        environment_factory (Callable): Builds each MarioController. Defaults to a headless
+            MarioController with the given act_freq.
+        act_freq (int): The ticks each action is held for. Defaults to 10.
+        initial_state (bytes): The savestate episodes start and auto-reset from. Defaults to
+            init.state.
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        workers: int | None = None,
+        environment_factory: Callable | None = None,
+        act_freq: int = 10,
+        initial_state: bytes | None = None,
+    ) -> None:
+        if environment_factory is None:
+            # Imported here so the parent process never loads the emulator
+            from mario_expert import (  # pylint: disable=import-outside-toplevel
+                MarioController,
+            )
+
+            environment_factory = functools.partial(
+                MarioController, act_freq=act_freq, headless=True
+            )
+
+        self.num_envs = num_envs
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = min(workers, num_envs)
+
+        self.buffers = _Buffers.allocate(num_envs)
+        self.episodes = np.zeros(num_envs, dtype=np.int64)
+        self._closed = False
+
+        self._local: _Shard | None = None
+        self._connections: list[Connection] = []
+        self._processes: list[multiprocessing.Process] = []
+
+        if self.workers <= 0:
+            self._local = _Shard(
+                range(num_envs), self.buffers, environment_factory, initial_state
+            )
+            return
+
+        # Contiguous shards that differ in size by at most one
+        bounds = np.linspace(0, num_envs, self.workers + 1).astype(int).tolist()
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_run_shard,
+                args=(
+                    child,
+                    range(start, stop),
+                    num_envs,
+                    self.buffers.raw,
+                    environment_factory,
+                    initial_state,
+                ),
+                name=f"mario-shard-{start}-{stop}",
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+        for connection in self._connections:
+            connection.recv()
+
+    def _broadcast(self, command: str) -> None:
+        if self._local is not None:
+            getattr(self._local, command)()
+            return
+
+        for connection in self._connections:
+            connection.send(command)
+        for connection in self._connections:
+            reply = connection.recv()
+            if reply != command:
+                raise RuntimeError(f"Shard replied {reply!r} to {command!r}")
+
+    def reset(self) -> VecObservation:
+        """
+        Resets every environment and returns their observations.
+        """
+        self._broadcast("reset")
+        return VecObservation(
+            self.buffers.game_areas.copy(), self.buffers.states.copy()
+        )
+
+    def step(self, actions) -> VecStep:
+        """
+        Runs one action in every environment, resetting any episode that ends.
+        """
+        buffers = self.buffers
+        buffers.actions[:] = actions
+        buffers.final_states[:] = np.zeros(1, dtype=STATE_DTYPE)
+
+        self._broadcast("step")
+
+        dones = buffers.dones.copy()
+        self.episodes += dones
+        return VecStep(
+            buffers.game_areas.copy(),
+            buffers.states.copy(),
+            dones,
+            buffers.final_states.copy(),
+        )
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._local is not None:
+            self._local.close()
+            return
+
+        for connection in self._connections:
+            connection.send("close")
+        for process in self._processes:
+            process.join()
+
+    def __enter__(self) -> "VecMarioEnvironment":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,156 @@
+"""
+Content-addressed virtualenvs for evaluating submissions.
+
+Environments are keyed by a hash of the normalised requirements, so every submission with the same
+dependency set shares one prebuilt environment. Packages are installed from a shared local wheel
+cache that is filled on first use, which keeps rebuilds fast and lets them run offline. Builds run
+on their own bounded thread pool so they overlap with downloading and never compete with the
+evaluation runs for slots.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+_COMPLETE_MARKER = ".complete"
+
+
+def normalise_requirements(text: str) -> list[str]:
+    """
+    Returns the requirement lines with comments, blanks, case, separators and order normalised.
+    Option lines are only trimmed.
+    """
+    requirements = set()
+    for line in text.splitlines():
+        # As in pip a comment starts a line or follows whitespace, so URL fragments survive
+        line = re.sub(r"(^|\s)#.*$", "", line).strip()
+        if not line:
+            continue
+        if line.startswith("-"):
+            # Options such as --index-url URL and -e path keep the space before their value
+            requirements.add(line)
+            continue
+        line = re.sub(r"\s+", "", line)
+        # Package names compare case-insensitively with -, _ and . equivalent (PEP 503)
+        match = re.match(r"^([A-Za-z0-9][A-Za-z0-9._-]*)(.*)$", line)
+        if match:
+            name = re.sub(r"[-_.]+", "-", match.group(1)).lower()
+            line = name + match.group(2)
+        requirements.add(line)
+    return sorted(requirements)
+
+
+def requirements_key(requirements: list[str]) -> str:
+    return hashlib.sha256("\n".join(requirements).encode("utf-8")).hexdigest()[:16]
+
+
+class VenvCache:
+    """
+    Builds and shares virtualenvs keyed by their requirements.
+
+    Args:
+        root (str): The directory environments and wheels are kept in. Defaults to ~/venv.
+        workers (int): The maximum number of concurrent environment builds. Defaults to 4.
+        offline (bool): Install only from the local wheel cache. Defaults to False.
+    """
+
+    def __init__(
+        self, root: str | None = None, workers: int = 4, offline: bool = False
+    ) -> None:
+        self.root = root or f"{os.path.expanduser('~')}/venv"
+        self.envs_path = f"{self.root}/envs"
+        self.wheels_path = f"{self.root}/wheels"
+        self.offline = offline
+
+        os.makedirs(self.envs_path, exist_ok=True)
+        os.makedirs(self.wheels_path, exist_ok=True)
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="venv-build"
+        )
+        self._builds: dict[str, Future] = {}
+        self._lock = Lock()
+
+    def submit(self, requirements_file: str) -> Future:
+        """
+        Schedules the environment for a requirements file and returns a future of its python path.
+
+        Submissions with identical requirements share a single build.
+        """
+        with open(requirements_file, "r", encoding="utf-8") as file:
+            requirements = normalise_requirements(file.read())
+        key = requirements_key(requirements)
+
+        with self._lock:
+            future = self._builds.get(key)
+            if future is None:
+                future = self._pool.submit(self._build, key, requirements)
+                self._builds[key] = future
+        return future
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def _build(self, key: str, requirements: list[str]) -> str:
+        env_dir = f"{self.envs_path}/{key}"
+        python_bin = f"{env_dir}/bin/python3"
+
+        if os.path.exists(f"{env_dir}/{_COMPLETE_MARKER}"):
+            logging.info(f"Reusing environment {key}")
+            return python_bin
+
+        # A file lock keeps separate grading processes from building the same environment at once
+        with open(f"{self.envs_path}/{key}.lock", "w", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if os.path.exists(f"{env_dir}/{_COMPLETE_MARKER}"):
+                return python_bin
+
+            logging.info(
+                f"Building environment {key} for {len(requirements)} requirements"
+            )
+
+            requirements_file = f"{self.envs_path}/{key}.txt"
+            with open(requirements_file, "w", encoding="utf-8") as file:
+                file.write("\n".join(requirements) + "\n")
+
+            self._run([sys.executable, "-m", "virtualenv", "--clear", env_dir])
+
+            if requirements:
+                if not self.offline:
+                    # Only fetches or builds what the wheel cache does not already have
+                    self._pip(
+                        python_bin,
+                        "wheel",
+                        requirements_file,
+                        "--wheel-dir",
+                        self.wheels_path,
+                    )
+                self._pip(python_bin, "install", requirements_file, "--no-index")
+
+            with open(f"{env_dir}/{_COMPLETE_MARKER}", "w", encoding="utf-8") as file:
+                file.write("\n".join(requirements) + "\n")
+
+        logging.info(f"Built environment {key}")
+        return python_bin
+
+    def _pip(
+        self, python_bin: str, command: str, requirements_file: str, *options: str
+    ) -> None:
+        self._run(
+            [python_bin, "-m", "pip", command, "--quiet", *options]
+            + ["--find-links", self.wheels_path, "-r", requirements_file]
+        )
+
+    def _run(self, command: list[str]) -> None:
+        result = subprocess.run(command, capture_output=True, text=True, check=False)
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"{' '.join(command)} failed:\n{result.stdout}\n{result.stderr}"
+            )
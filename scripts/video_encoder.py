@@ -0,0 +1,144 @@
+"""
+Background video encoding for the Mario Expert agent.
+
+The control loop only copies the raw emulator screen into a preallocated ring of buffers, a
+worker thread does the resize, colour conversion and mp4 encoding. OpenCV releases the GIL for
+all three so the encoding overlaps almost completely with emulation and decision making. OpenCV
+is only imported once a writer is created, so importing this module is free for runs that never
+record.
+"""
+
+import queue
+import threading
+import time
+
+import numpy as np
+from telemetry import ENCODE
+
+
+class AsyncVideoWriter:
+    """
+    A drop-in replacement for cv2.VideoWriter that encodes on a background thread.
+
+    Frames are pushed with write_screen (raw RGBA screen buffers) or write (already converted BGR
+    frames). When every ring slot is waiting to be encoded the producer blocks, so memory stays
+    bounded if the encoder falls behind.
+
+    Args:
+        video_name (str): The path of the mp4 file to write.
+        width (int): The width of the encoded video.
+        height (int): The height of the encoded video.
+        fps (int): The frame rate of the encoded video. Defaults to 30.
+        screen_shape (tuple): The shape of the raw screen buffers. Defaults to (144, 160, 4).
+        capacity (int): The number of preallocated ring slots. Defaults to 16.
+    """
+
+    def __init__(
+        self,
+        video_name: str,
+        width: int,
+        height: int,
+        fps: int = 30,
+        screen_shape: tuple[int, int, int] = (144, 160, 4),
+        capacity: int = 16,
+    ) -> None:
+        self.width = width
+        self.height = height
+
+        import cv2  # pylint: disable=import-outside-toplevel
+
+        self.writer = cv2.VideoWriter(
+            video_name, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+        )
+
+        self._screens = np.empty((capacity, *screen_shape), dtype=np.uint8)
+        self._frames = np.empty((capacity, height, width, 3), dtype=np.uint8)
+
+        # Slots cycle free -> pending -> free, each entry is (slot, is_raw_screen)
+        self._free: queue.Queue = queue.Queue()
+        for slot in range(capacity):
+            self._free.put(slot)
+        self._pending: queue.Queue = queue.Queue()
+
+        self._error: BaseException | None = None
+        self._closed = False
+
+        # Set to a Telemetry to record how long each frame takes to encode
+        self.telemetry = None
+
+        self._worker = threading.Thread(
+            target=self._encode, name="video-encoder", daemon=True
+        )
+        self._worker.start()
+
+    def write_screen(self, screen: np.ndarray) -> None:
+        """
+        Queues a raw RGBA screen buffer for encoding - the buffer is copied before returning.
+        """
+        slot = self._acquire()
+        np.copyto(self._screens[slot], screen)
+        self._pending.put((slot, True))
+
+    def write(self, frame: np.ndarray) -> None:
+        """
+        Queues an already resized BGR frame, matching the cv2.VideoWriter interface.
+        """
+        slot = self._acquire()
+        np.copyto(self._frames[slot], frame)
+        self._pending.put((slot, False))
+
+    def release(self) -> None:
+        """
+        Encodes every queued frame, stops the worker and closes the file.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        self._pending.put(None)
+        self._worker.join()
+        self.writer.release()
+
+        self._raise_error()
+
+    def _acquire(self) -> int:
+        self._raise_error()
+        if self._closed:
+            raise RuntimeError("Cannot write to a released AsyncVideoWriter")
+        return self._free.get()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Video encoding failed") from error
+
+    def _encode(self) -> None:
+        import cv2  # pylint: disable=import-outside-toplevel
+
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+
+            slot, is_screen = item
+            start = time.perf_counter_ns()
+            try:
+                if self._error is None:
+                    if is_screen:
+                        frame = cv2.resize(
+                            self._screens[slot], (self.width, self.height)
+                        )
+                        # Convert to BGR for use with OpenCV
+                        frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
+                    else:
+                        frame = self._frames[slot]
+                    self.writer.write(frame)
+            except Exception as error:  # pylint: disable=broad-except
+                # Keep draining so the producer never deadlocks, the error surfaces on next write
+                self._error = error
+            finally:
+                self._free.put(slot)
+
+            telemetry = self.telemetry
+            if telemetry is not None:
+                telemetry.record(ENCODE, time.perf_counter_ns() - start)